@@ -1,29 +1,30 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from typing import Optional
 import uvicorn
+import asyncio
 import time
 import logging
 import socketio
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.requests import Request
 
-from database import engine, Base, create_default_admin, init_db
+from database import async_engine, init_db, warm_pool, check_database, pool_status
 from routes import router
+from realtime import sio, emit, raffle_room, raffle_updates, spin_relay, draw_state
+from auth import admin_from_token, get_current_admin
+from reservations import reservation_sweeper
+from passwords import password_pool
 from config import settings  # IMPORTACIÓN AÑADIDA
+from metrics import MetricsMiddleware, registry
+from sqltrace import SQLTraceMiddleware
+import metrics
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Crear servidor Socket.IO
-sio = socketio.AsyncServer(
-    async_mode='asgi',
-    cors_allowed_origins="*",
-    logger=True,
-    engineio_logger=True
-)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Inicializar base de datos
@@ -34,9 +35,25 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error inicializando base de datos: {e}")
         raise
     
+    # Abrir las conexiones mínimas del pool antes de recibir tráfico
+    warmed = await warm_pool()
+    if warmed:
+        logger.info(f"Pool de conexiones precalentado con {warmed} conexiones")
+    
+    # Liberar reservas vencidas en segundo plano
+    sweeper_task = asyncio.create_task(reservation_sweeper())
+    
     yield
     
     logger.info("Apagando aplicación...")
+    sweeper_task.cancel()
+    try:
+        await sweeper_task
+    except asyncio.CancelledError:
+        pass
+    await raffle_updates.close()
+    await async_engine.dispose()
+    password_pool.shutdown()
 
 # Crear aplicación FastAPI
 app = FastAPI(
@@ -59,27 +76,76 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Latencia y códigos por ruta para /metrics
+app.add_middleware(MetricsMiddleware)
+# Consultas SQL por petición (headers X-DB-* en DEBUG) y consultas lentas
+app.add_middleware(SQLTraceMiddleware)
+
 # Incluir rutas API
 app.include_router(router, prefix="/api")
 
 # Eventos de Socket.IO
+def _raffle_id(data) -> Optional[int]:
+    raffle_id = data.get("raffle_id", data.get("raffleId")) if isinstance(data, dict) else None
+    return raffle_id if isinstance(raffle_id, int) else None
+
 @sio.event
-async def connect(sid, environ):
-    logger.info(f"Cliente conectado: {sid}")
+async def connect(sid, environ, auth=None):
+    # Los espectadores se conectan sin token; solo un admin puede emitir eventos del sorteo
+    admin = await admin_from_token((auth or {}).get("token") if isinstance(auth, dict) else None)
+    await sio.save_session(sid, {"admin": admin.username if admin else None})
+    metrics.socketio_connections.inc()
+    metrics.socketio_clients.inc()
+    logger.debug(f"Cliente conectado: {sid} (admin: {admin.username if admin else 'no'})")
 
 @sio.event
 async def disconnect(sid):
-    logger.info(f"Cliente desconectado: {sid}")
+    metrics.socketio_clients.dec()
+    logger.debug(f"Cliente desconectado: {sid}")
+
+@sio.event
+async def join_raffle(sid, data):
+    """El cliente recibe los eventos de la rifa que está viendo y el sorteo en curso, si lo hay"""
+    raffle_id = _raffle_id(data)
+    if raffle_id is not None:
+        await sio.enter_room(sid, raffle_room(raffle_id))
+        state = draw_state.snapshot(raffle_id)
+        if state is not None:
+            await emit('draw_state', state, to=sid)
+
+@sio.event
+async def leave_raffle(sid, data):
+    raffle_id = _raffle_id(data)
+    if raffle_id is not None:
+        await sio.leave_room(sid, raffle_room(raffle_id))
+
+async def _is_admin(sid) -> bool:
+    """Se revalida en cada emisión (vía la caché de admins) por si la cuenta se desactivó"""
+    username = (await sio.get_session(sid)).get("admin")
+    if not username:
+        return False
+    try:
+        await get_current_admin(username)
+    except HTTPException:
+        return False
+    return True
 
 @sio.event
 async def wheel_spin(sid, data):
-    logger.info(f"Evento wheel_spin recibido de {sid}: {data}")
-    await sio.emit('wheel_spin', data, skip_sid=sid)
+    raffle_id = _raffle_id(data)
+    if raffle_id is None or not await _is_admin(sid):
+        return {"error": "No autorizado"}
+    draw_state.spin(raffle_id, data)
+    await spin_relay.push(raffle_id, data, sender_sid=sid)
 
 @sio.event
 async def winner_selected(sid, data):
-    logger.info(f"Evento winner_selected recibido de {sid}: {data}")
-    await sio.emit('winner_selected', data, skip_sid=sid)
+    raffle_id = _raffle_id(data)
+    if raffle_id is None or not await _is_admin(sid):
+        return {"error": "No autorizado"}
+    logger.info(f"Ganador anunciado en rifa {raffle_id}")
+    draw_state.winner(raffle_id, data)
+    await emit('winner_selected', data, room=raffle_room(raffle_id), skip_sid=sid)
 
 # Ruta raíz
 @app.get("/")
@@ -94,15 +160,42 @@ def read_root():
     }
 
 @app.get("/health")
-def health_check():
-    return {
-        "status": "healthy",
-        "timestamp": time.time(),
-        "database": "connected" if engine else "disconnected"
-    }
+async def health_check():
+    """
+    Sondeo para el balanceador: 503 si la base no responde o si el pool está
+    casi agotado, para que deje de enviar tráfico antes de que los checkouts
+    empiecen a vencer
+    """
+    pool = pool_status()
+    saturated = pool is not None and pool["saturation"] >= settings.HEALTH_POOL_SATURATION_THRESHOLD
+    if saturated:
+        # Con el pool agotado el sondeo solo esperaría una conexión; no se ocupa otra
+        database = {"connected": True, "latency_ms": None}
+        status_name = "degraded"
+    else:
+        database = await check_database()
+        status_name = "healthy" if database["connected"] else "unhealthy"
+    return JSONResponse(
+        status_code=200 if status_name == "healthy" else 503,
+        content={
+            "status": status_name,
+            "timestamp": time.time(),
+            "database": "connected" if database["connected"] else "disconnected",
+            "database_latency_ms": database["latency_ms"],
+            "pool": pool
+        }
+    )
+
+@app.get("/metrics")
+def metrics_endpoint(request: Request):
+    """Métricas de este proceso en formato de texto de Prometheus"""
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return PlainTextResponse("No autorizado", status_code=401)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-# Crear aplicación ASGI combinada
-app.mount("/socket.io/", socketio.ASGIApp(sio))
+# Crear aplicación ASGI combinada. El Mount ya filtra /socket.io/ y le quita el
+# prefijo al path, así que Engine.IO debe atender cualquier path que le llegue
+app.mount("/socket.io/", socketio.ASGIApp(sio, socketio_path=None))
 
 # Handler para rutas no encontradas
 @app.exception_handler(404)
@@ -3,13 +3,15 @@ from typing import Optional, Union
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 import logging
 
 from config import settings
-from database import get_db
+from database import AsyncSessionLocal
 from models import Admin
+from cache import TTLCache
+from passwords import password_pool, PasswordPoolBusy
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -17,6 +19,25 @@ logger = logging.getLogger(__name__)
 # Configuración de seguridad
 security = HTTPBearer()
 
+class AdminPrincipal:
+    """Identidad del admin autenticado, desacoplada de la sesión de base de datos"""
+    
+    __slots__ = ("id", "username", "email", "is_active", "is_main_admin")
+    
+    def __init__(self, admin: Admin):
+        self.id = admin.id
+        self.username = admin.username
+        self.email = admin.email
+        self.is_active = admin.is_active
+        self.is_main_admin = admin.is_main_admin
+
+# Admins ya verificados por username. Los cambios hechos en este proceso la
+# invalidan al momento; los de otros workers se ven como mucho tras el TTL
+admin_cache = TTLCache(settings.ADMIN_CACHE_TTL_SECONDS)
+
+def invalidate_admin_cache(username: str):
+    admin_cache.invalidate(username)
+
 # Funciones de token JWT
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -48,17 +69,19 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_admin(
-    username: str = Depends(verify_token),
-    db: Session = Depends(get_db)
-) -> Admin:
-    admin = db.query(Admin).filter(Admin.username == username).first()
+async def get_current_admin(username: str = Depends(verify_token)) -> AdminPrincipal:
+    admin = admin_cache.get(username)
     if admin is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Administrador no encontrado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        async with AsyncSessionLocal() as db:
+            db_admin = await db.scalar(select(Admin).where(Admin.username == username))
+        if db_admin is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Administrador no encontrado",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        admin = AdminPrincipal(db_admin)
+        admin_cache.set(username, admin)
     if not admin.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,10 +90,38 @@ def get_current_admin(
         )
     return admin
 
-def authenticate_admin(db: Session, username: str, password: str) -> Union[Admin, None]:
+async def admin_from_token(token: Optional[str]) -> Optional[AdminPrincipal]:
+    """Valida un token fuera de las dependencias de FastAPI (conexiones Socket.IO)"""
+    if not token:
+        return None
+    try:
+        username = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    if username is None:
+        return None
+    try:
+        return await get_current_admin(username)
+    except HTTPException:
+        return None
+
+async def authenticate_admin(db: AsyncSession, username: str, password: str) -> Union[Admin, None]:
     logger.info(f"Intento de autenticación para usuario: {username}")
+    try:
+        return await _authenticate_admin(db, username, password)
+    except PasswordPoolBusy:
+        logger.warning(f"Cola de verificación llena; login de {username} rechazado")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos de inicio de sesión, intente de nuevo en unos segundos",
+            headers={"Retry-After": "1"},
+        )
+
+async def _authenticate_admin(db: AsyncSession, username: str, password: str) -> Union[Admin, None]:
+    # Rechazo rápido antes de tocar la base de datos si bcrypt está saturado
+    password_pool.check_admission()
     
-    admin = db.query(Admin).filter(Admin.username == username).first()
+    admin = await db.scalar(select(Admin).where(Admin.username == username))
     
     if not admin:
         logger.warning(f"Admin '{username}' no encontrado en la base de datos")
@@ -86,14 +137,11 @@ def authenticate_admin(db: Session, username: str, password: str) -> Union[Admin
     
     logger.info(f"Verificando contraseña para {username}")
     
-    # Verificar contraseña
-    try:
-        if admin.verify_password(password):
-            logger.info(f"Contraseña válida para {username}")
-            return admin
-        else:
-            logger.warning(f"Contraseña incorrecta para {username}")
-            return None
-    except Exception as e:
-        logger.error(f"Error al verificar contraseña: {e}")
-        return None
+    # Verificar contraseña en el pool acotado de bcrypt (no bloquea el event loop)
+    valid = await password_pool.verify(password, admin.password_hash)
+    
+    if valid:
+        logger.info(f"Contraseña válida para {username}")
+        return admin
+    logger.warning(f"Contraseña incorrecta para {username}")
+    return None
@@ -0,0 +1,79 @@
+"""
+Latencia de una ruta pública mientras se inunda /api/auth/login.
+
+Mide p50/p95 de GET /api/raffles/ en reposo y luego durante un aluvión de
+intentos de login con contraseña incorrecta. Con bcrypt en su pool acotado la
+latencia pública debe mantenerse plana y el exceso de logins recibir 429.
+
+    uvicorn app:app --port 8000
+    python benchmarks/bench_login_flood.py --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _sample_public_latency(client, samples, interval):
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await client.get("/api/raffles/")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _flood_logins(client, stop, statuses, username):
+    while not stop.is_set():
+        response = await client.post("/api/auth/login", json={
+            "username": username,
+            "password": "ContraseñaIncorrecta1"
+        })
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+def _report(name, latencies):
+    print(
+        f"{name:<18} p50={statistics.median(latencies):7.1f} ms  "
+        f"p95={_percentile(latencies, 95):7.1f} ms  max={max(latencies):7.1f} ms"
+    )
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.flood_concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        idle = await _sample_public_latency(client, args.samples, args.interval)
+        _report("En reposo", idle)
+
+        stop = asyncio.Event()
+        statuses = {}
+        flood = [
+            asyncio.create_task(_flood_logins(client, stop, statuses, args.admin_username))
+            for _ in range(args.flood_concurrency)
+        ]
+        await asyncio.sleep(0.5)
+        loaded = await _sample_public_latency(client, args.samples, args.interval)
+        stop.set()
+        await asyncio.gather(*flood)
+
+        _report("Durante el aluvión", loaded)
+        print(f"Respuestas de login: { {str(code): count for code, count in sorted(statuses.items())} }")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--flood-concurrency", type=int, default=100)
+    parser.add_argument("--admin-username", default="admin")
+    asyncio.run(main(parser.parse_args()))
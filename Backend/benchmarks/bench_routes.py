@@ -0,0 +1,129 @@
+"""
+Benchmark de requests/seg sobre /api/raffles/ y /api/tickets/purchase.
+
+Se ejecuta contra un servidor ya levantado, por ejemplo:
+
+    uvicorn app:app --port 8000
+    python benchmarks/bench_routes.py --base-url http://localhost:8000 --output after.json
+
+Para comparar antes/después se corre el mismo comando sobre cada versión del
+código y se pasa el resultado anterior con --compare:
+
+    python benchmarks/bench_routes.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import httpx
+
+
+async def _run_load(name, make_request, total_requests, concurrency):
+    """Lanza total_requests peticiones con `concurrency` trabajadores en paralelo"""
+    counter = iter(range(total_requests))
+    statuses = {}
+
+    async def worker():
+        for index in counter:
+            response = await make_request(index)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total_requests / elapsed, 1),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())}
+    }
+    print(f"{name:<28} {result['requests_per_second']:>10} req/s  {result['status_codes']}")
+    return result
+
+
+async def _prepare_purchase_data(client, total_requests, admin_username, admin_password):
+    """Crea las rifas y usuarios necesarios para que cada compra use un número libre"""
+    login = await client.post("/api/auth/login", json={
+        "username": admin_username,
+        "password": admin_password
+    })
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    # Las rifas admiten hasta 1000 números; se crean las necesarias
+    tickets_per_raffle = 1000
+    raffle_ids = []
+    for index in range(0, total_requests, tickets_per_raffle):
+        response = await client.post("/api/raffles/", headers=headers, json={
+            "title": f"Benchmark {uuid.uuid4().hex[:8]}",
+            "total_tickets": tickets_per_raffle,
+            "ticket_price": 1,
+            "prize_first": "Primero",
+            "prize_second": "Segundo",
+            "prize_third": "Tercero"
+        })
+        response.raise_for_status()
+        raffle_ids.append(response.json()["id"])
+
+    response = await client.post("/api/users/", json={
+        "name": "Benchmark",
+        "phone": str(uuid.uuid4().int)[:12]
+    })
+    response.raise_for_status()
+    return raffle_ids, tickets_per_raffle, response.json()["id"]
+
+
+async def main(args):
+    results = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        results["GET /api/raffles/"] = await _run_load(
+            "GET /api/raffles/",
+            lambda index: client.get("/api/raffles/"),
+            args.requests,
+            args.concurrency
+        )
+
+        raffle_ids, tickets_per_raffle, user_id = await _prepare_purchase_data(
+            client, args.requests, args.admin_username, args.admin_password
+        )
+        results["POST /api/tickets/purchase"] = await _run_load(
+            "POST /api/tickets/purchase",
+            lambda index: client.post("/api/tickets/purchase", json={
+                "user_id": user_id,
+                "raffle_id": raffle_ids[index // tickets_per_raffle],
+                "ticket_numbers": [index % tickets_per_raffle + 1]
+            }),
+            args.requests,
+            args.concurrency
+        )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nComparación con", args.compare)
+        for name, result in results.items():
+            before = baseline.get(name, {}).get("requests_per_second")
+            if before:
+                change = (result["requests_per_second"] - before) / before * 100
+                print(f"{name:<28} {before:>10} -> {result['requests_per_second']:<10} ({change:+.1f}%)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--admin-username", default=os.getenv("ADMIN_USERNAME", "admin"))
+    parser.add_argument("--admin-password", default=os.getenv("ADMIN_PASSWORD", "Admin123!"))
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    asyncio.run(main(parser.parse_args()))
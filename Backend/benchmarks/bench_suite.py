@@ -0,0 +1,368 @@
+"""
+Suite de carga reproducible para las rutas calientes: compras, confirmación
+de pagos, sorteo, listado de pendientes y difusión por Socket.IO.
+
+Por defecto levanta la app en el mismo proceso (httpx + ASGI) sobre una base
+SQLite temporal; con DATABASE_URL se usa esa base (por ejemplo un Postgres
+local de pruebas). Con --base-url se mide un servidor ya levantado:
+
+    python benchmarks/bench_suite.py --output baseline.json
+    DATABASE_URL=postgresql://localhost/raffle_bench python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --base-url http://localhost:8000 --fanout-clients 200
+
+Cada escenario reporta p50/p95/p99, throughput, códigos de respuesta y
+consultas SQL por petición (headers X-DB-* que la app envía con DEBUG=true;
+en proceso se activa solo). Con --compare se compara contra una ejecución
+guardada y el script termina con código 1 si algún escenario empeora más que
+--tolerance, así que sirve como paso de CI.
+
+La difusión por Socket.IO necesita un servidor real (--base-url) y el cliente
+async de python-socketio (aiohttp); sin ellos el escenario se omite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICKETS_PER_RAFFLE = 1000
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summarize(latencies, elapsed, statuses, db_queries, db_times):
+    """Resumen de un escenario; latencias en ms"""
+    result = {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "db_queries_per_request": round(statistics.mean(db_queries), 2) if db_queries else None,
+        "db_ms_per_request": round(statistics.mean(db_times), 2) if db_times else None
+    }
+    return result
+
+
+def _print_result(name, result):
+    queries = result["db_queries_per_request"]
+    print(
+        f"{name:<26} p50={result['p50_ms']:8.1f} ms  p95={result['p95_ms']:8.1f} ms  "
+        f"p99={result['p99_ms']:8.1f} ms  {result['requests_per_second'] or 0:>8} req/s  "
+        f"consultas={'-' if queries is None else queries}  {result['status_codes']}"
+    )
+
+
+async def _run_load(name, make_request, total_requests, concurrency, on_response=None):
+    """Lanza total_requests peticiones con `concurrency` trabajadores y mide cada una"""
+    counter = iter(range(total_requests))
+    latencies, db_queries, db_times = [], [], []
+    statuses = {}
+
+    async def worker():
+        for index in counter:
+            start = time.perf_counter()
+            response = await make_request(index)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if "x-db-queries" in response.headers:
+                db_queries.append(int(response.headers["x-db-queries"]))
+                db_times.append(float(response.headers["x-db-time"].rstrip("ms")))
+            if on_response:
+                on_response(index, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = _summarize(latencies, time.perf_counter() - start, statuses, db_queries, db_times)
+    _print_result(name, result)
+    return result
+
+
+@asynccontextmanager
+async def _client(args):
+    """Cliente contra --base-url, o contra la app en este proceso con su lifespan"""
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+            yield client
+        return
+
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="raffle_bench_"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("DEBUG", "true")
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+async def _admin_headers(client, args):
+    login = await client.post("/api/auth/login", json={
+        "username": args.admin_username,
+        "password": args.admin_password
+    })
+    login.raise_for_status()
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+async def _create_raffles(client, headers, count):
+    raffle_ids = []
+    for _ in range(count):
+        response = await client.post("/api/raffles/", headers=headers, json={
+            "title": f"Benchmark {uuid.uuid4().hex[:8]}",
+            "total_tickets": TICKETS_PER_RAFFLE,
+            "ticket_price": 1,
+            "prize_first": "Primero",
+            "prize_second": "Segundo",
+            "prize_third": "Tercero"
+        })
+        response.raise_for_status()
+        raffle_ids.append(response.json()["id"])
+    return raffle_ids
+
+
+async def _create_users(client, count):
+    user_ids = []
+    for _ in range(count):
+        response = await client.post("/api/users/", json={
+            "name": "Benchmark",
+            "phone": str(uuid.uuid4().int)[:12]
+        })
+        response.raise_for_status()
+        user_ids.append(response.json()["id"])
+    return user_ids
+
+
+async def _bench_fanout(args, raffle_id, user_id):
+    """
+    N clientes en la sala de una rifa; mide desde que sale cada compra hasta que
+    cada cliente recibe su raffle_update (incluye la ventana de agrupación)
+    """
+    try:
+        import socketio
+        import aiohttp  # noqa: F401
+    except ImportError:
+        print(f"{'socketio fan-out':<26} omitido: requiere python-socketio[asyncio_client]")
+        return None
+
+    loop = asyncio.get_running_loop()
+    sent_at = {}
+    delays = []
+    clients = []
+    for _ in range(args.fanout_clients):
+        sio = socketio.AsyncClient(reconnection=False)
+
+        @sio.on("raffle_update")
+        async def on_update(data):
+            now = loop.time()
+            for number in data.get("reserved_numbers", []):
+                if number in sent_at:
+                    delays.append((now - sent_at[number]) * 1000)
+
+        await sio.connect(args.base_url, transports=["websocket"])
+        await sio.emit("join_raffle", {"raffle_id": raffle_id})
+        clients.append(sio)
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        for number in range(1, args.fanout_events + 1):
+            sent_at[number] = loop.time()
+            await client.post("/api/tickets/purchase", json={
+                "user_id": user_id,
+                "raffle_id": raffle_id,
+                "ticket_numbers": [number]
+            })
+            await asyncio.sleep(args.fanout_interval)
+    # Esperar la última ventana de agrupación
+    await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+
+    for sio in clients:
+        await sio.disconnect()
+
+    expected = args.fanout_clients * args.fanout_events
+    if not delays:
+        print(f"{'socketio fan-out':<26} ningún cliente recibió eventos")
+        return None
+    result = _summarize(delays, elapsed, {"entregas": len(delays)}, [], [])
+    result["requests_per_second"] = round(len(delays) / elapsed, 1)
+    result["clients"] = args.fanout_clients
+    result["delivered_ratio"] = round(len(delays) / expected, 4)
+    _print_result("socketio fan-out", result)
+    return result
+
+
+async def run_suite(args):
+    rng = random.Random(args.seed)
+    results = {}
+    async with _client(args) as client:
+        headers = await _admin_headers(client, args)
+        user_ids = await _create_users(client, args.users)
+
+        # Compras sobre números disjuntos: cada petición reserva números libres
+        per_purchase = args.tickets_per_purchase
+        purchases_per_raffle = TICKETS_PER_RAFFLE // per_purchase
+        disjoint_raffles = await _create_raffles(client, headers, -(-args.purchases // purchases_per_raffle))
+        reserved_batches = []
+
+        def disjoint_purchase(index):
+            raffle_id = disjoint_raffles[index // purchases_per_raffle]
+            first = (index % purchases_per_raffle) * per_purchase + 1
+            return client.post("/api/tickets/purchase", json={
+                "user_id": user_ids[index % len(user_ids)],
+                "raffle_id": raffle_id,
+                "ticket_numbers": list(range(first, first + per_purchase))
+            })
+
+        def keep_tickets(index, response):
+            if response.status_code == 200:
+                tickets = response.json()["tickets"]
+                reserved_batches.append((tickets[0]["user_id"], [ticket["id"] for ticket in tickets]))
+
+        results["purchase_disjoint"] = await _run_load(
+            "purchase (disjuntos)", disjoint_purchase, args.purchases, args.concurrency, keep_tickets
+        )
+
+        # Compras que compiten por pocos números: mide el costo de los conflictos
+        hot_raffle = (await _create_raffles(client, headers, 1))[0]
+        hot_picks = [rng.sample(range(1, args.hot_numbers + 1), min(per_purchase, args.hot_numbers))
+                     for _ in range(args.overlap_purchases)]
+        results["purchase_overlap"] = await _run_load(
+            "purchase (solapados)",
+            lambda index: client.post("/api/tickets/purchase", json={
+                "user_id": user_ids[index % len(user_ids)],
+                "raffle_id": hot_raffle,
+                "ticket_numbers": hot_picks[index]
+            }),
+            args.overlap_purchases,
+            args.concurrency
+        )
+
+        # Listado de pendientes con todas las reservas anteriores
+        results["pending_tickets"] = await _run_load(
+            "tickets/pending",
+            lambda index: client.get("/api/tickets/pending", headers=headers),
+            args.pending_samples,
+            min(args.concurrency, 10)
+        )
+        results["pending_tickets"]["rows"] = len((await client.get("/api/tickets/pending", headers=headers)).json())
+
+        # Confirmación de pagos, un lote por compra
+        results["confirm_payment"] = await _run_load(
+            "confirm-payment (lotes)",
+            lambda index: client.post("/api/tickets/confirm-payment", headers=headers, json={
+                "user_id": reserved_batches[index][0],
+                "ticket_ids": reserved_batches[index][1]
+            }),
+            len(reserved_batches),
+            args.concurrency
+        )
+
+        # Sorteo sobre rifas llenas y pagadas: una petición por rifa y posición
+        for position in (1, 2, 3):
+            results[f"draw_position_{position}"] = await _run_load(
+                f"draw (posición {position})",
+                lambda index, position=position: client.post("/api/draw", headers=headers, json={
+                    "raffle_id": disjoint_raffles[index],
+                    "prize_position": position
+                }),
+                len(disjoint_raffles),
+                args.concurrency
+            )
+
+        if args.base_url and args.fanout_clients:
+            fanout_raffle = (await _create_raffles(client, headers, 1))[0]
+            fanout = await _bench_fanout(args, fanout_raffle, user_ids[0])
+            if fanout:
+                results["socketio_fanout"] = fanout
+        elif args.fanout_clients:
+            print(f"{'socketio fan-out':<26} omitido: requiere --base-url")
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Imprime la diferencia con la línea base; devuelve los escenarios que empeoraron"""
+    regressions = []
+    print(f"\n{'escenario':<26} {'p95 antes':>10} {'p95 ahora':>10} {'req/s antes':>12} {'req/s ahora':>12} {'consultas':>14}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f"{name:<26} (sin línea base)")
+            continue
+        worse = []
+        if before.get("p95_ms") and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            worse.append("p95")
+        if before.get("requests_per_second") and result["requests_per_second"] < before["requests_per_second"] * (1 - tolerance):
+            worse.append("throughput")
+        queries_before, queries_now = before.get("db_queries_per_request"), result["db_queries_per_request"]
+        if queries_before and queries_now is not None and queries_now > queries_before * (1 + tolerance):
+            worse.append("consultas")
+        print(
+            f"{name:<26} {before.get('p95_ms', '-'):>10} {result['p95_ms']:>10} "
+            f"{before.get('requests_per_second', '-'):>12} {result['requests_per_second']:>12} "
+            f"{str(queries_before) + ' -> ' + str(queries_now):>14}"
+            + (f"  REGRESIÓN ({', '.join(worse)})" if worse else "")
+        )
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Servidor ya levantado; sin esto la app corre en este proceso")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--purchases", type=int, default=1000)
+    parser.add_argument("--tickets-per-purchase", type=int, default=5)
+    parser.add_argument("--overlap-purchases", type=int, default=300)
+    parser.add_argument("--hot-numbers", type=int, default=20, help="Números por los que compiten las compras solapadas")
+    parser.add_argument("--pending-samples", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--fanout-clients", type=int, default=100)
+    parser.add_argument("--fanout-events", type=int, default=50)
+    parser.add_argument("--fanout-interval", type=float, default=0.05)
+    parser.add_argument("--admin-username", default=os.getenv("ADMIN_USERNAME", "admin"))
+    parser.add_argument("--admin-password", default=os.getenv("ADMIN_PASSWORD", "Admin123!"))
+    parser.add_argument("--output", help="Guardar resultados en JSON (línea base)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento admitido antes de marcar regresión")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_suite(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegresiones: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Revisa con EXPLAIN en PostgreSQL que las consultas calientes de tickets/winners
+usan índices. La verificación que corre con la suite es
+tests/test_query_plans.py (SQLite); este script sirve para confirmar el plan
+real de PostgreSQL con un volumen grande. Termina con código 1 si alguna
+consulta cae en un Seq Scan. Usar siempre contra una base de pruebas:
+
+    DATABASE_URL=postgresql://localhost/raffle_bench \\
+        python benchmarks/explain_hot_queries.py --seed-tickets 200000
+
+--seed-tickets inserta un conjunto sintético grande (la mayoría PAID) para que
+el planificador tenga estadísticas realistas; sin él se usan los datos actuales.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+from database import engine, init_db  # noqa: E402
+from models import User, Raffle, Ticket, Winner, TicketStatus, ACTIVE_TICKET_STATUSES  # noqa: E402
+
+TICKETS_PER_RAFFLE = 1000
+
+
+def hot_queries(raffle_id: int, user_id: int):
+    """Consultas de las rutas más usadas, con los mismos filtros que routes.py"""
+    return {
+        "tickets por rifa y estado (compras, mapa de ocupación)": select(Ticket.ticket_number).where(
+            Ticket.raffle_id == raffle_id,
+            Ticket.status.in_(ACTIVE_TICKET_STATUSES)
+        ),
+        "tickets por usuario": select(Ticket).where(Ticket.user_id == user_id),
+        "página de tickets por rifa (cursor)": select(Ticket).where(
+            Ticket.raffle_id == raffle_id,
+            Ticket.id > 0
+        ).order_by(Ticket.id).limit(100),
+        "tickets pendientes de pago": select(Ticket).where(
+            Ticket.status == TicketStatus.RESERVED,
+            Ticket.payment_confirmed == False
+        ),
+        "ganador por rifa y posición": select(Winner).where(
+            Winner.raffle_id == raffle_id,
+            Winner.prize_position == 1
+        ),
+    }
+
+
+def seed(connection, total_tickets: int):
+    rng = random.Random(42)
+    raffles = max(1, total_tickets // TICKETS_PER_RAFFLE)
+    users = max(1, total_tickets // 20)
+    now = datetime.utcnow()
+
+    raffle_ids = [
+        connection.execute(insert(Raffle).values(
+            title=f"Explain {index}", total_tickets=TICKETS_PER_RAFFLE, ticket_price=1,
+            prize_first="1", prize_second="2", prize_third="3", created_at=now
+        )).inserted_primary_key[0]
+        for index in range(raffles)
+    ]
+    first_user = connection.execute(insert(User).values(
+        name="Explain", phone=f"9{rng.randrange(10**10):010d}", created_at=now
+    )).inserted_primary_key[0]
+    connection.execute(insert(User), [
+        {"name": f"Explain {index}", "phone": f"8{first_user:07d}{index:08d}", "created_at": now}
+        for index in range(users - 1)
+    ])
+
+    rows = []
+    for raffle_id in raffle_ids:
+        for number in range(1, TICKETS_PER_RAFFLE + 1):
+            roll = rng.random()
+            status = TicketStatus.PAID if roll < 0.8 else TicketStatus.RESERVED if roll < 0.85 else TicketStatus.CANCELLED
+            rows.append({
+                "ticket_number": number,
+                "user_id": first_user + rng.randrange(users),
+                "raffle_id": raffle_id,
+                "purchase_date": now - timedelta(hours=rng.randrange(24 * 30)),
+                "status": status,
+                "payment_confirmed": status == TicketStatus.PAID,
+                "is_winner": False,
+            })
+        if len(rows) >= 50000:
+            connection.execute(insert(Ticket), rows)
+            rows = []
+    if rows:
+        connection.execute(insert(Ticket), rows)
+    return raffle_ids[0], first_user
+
+
+def sequential_scans(connection, statement):
+    """Devuelve las tablas que el plan recorre completas"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return scans
+
+
+def main(args):
+    if engine.dialect.name != "postgresql":
+        sys.exit("Solo para PostgreSQL; en SQLite usar: python -m pytest tests/test_query_plans.py")
+    init_db()
+    with engine.begin() as connection:
+        if args.seed_tickets:
+            raffle_id, user_id = seed(connection, args.seed_tickets)
+        else:
+            raffle_id = connection.scalar(select(Raffle.id).limit(1)) or 1
+            user_id = connection.scalar(select(User.id).limit(1)) or 1
+        connection.execute(text("ANALYZE"))
+
+        failures = 0
+        for name, statement in hot_queries(raffle_id, user_id).items():
+            scans = sequential_scans(connection, statement)
+            print(f"{'FALLA' if scans else 'OK':<6} {name}" + (f": {', '.join(scans)}" if scans else ""))
+            failures += bool(scans)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed-tickets", type=int, default=0, help="Insertar N tickets sintéticos antes de analizar")
+    main(parser.parse_args())
@@ -0,0 +1,294 @@
+"""
+Genera un conjunto de datos sintético y determinista para benchmarks o para
+reproducir problemas de producción: cientos de rifas, ~100k usuarios, millones
+de tickets en todos los estados y ganadores en las rifas completadas.
+
+    DATABASE_URL=postgresql://localhost/raffle_bench \\
+        python benchmarks/generate_data.py --raffles 3000 --users 100000
+
+En PostgreSQL las filas se cargan con COPY; en SQLite (o cualquier otro motor)
+con executemany en lotes. Los ids se asignan aquí a continuación del máximo
+actual, así los ganadores pueden referenciar sus tickets sin consultas extra,
+y al final se ajustan las secuencias. tickets_sold / tickets_reserved de cada
+rifa se recalculan en SQL a partir de los tickets cargados.
+
+La misma semilla y --base-date producen exactamente los mismos datos. Por
+defecto --base-date es hoy a medianoche (UTC), para que las reservas queden
+dentro de su plazo y el barrido de vencidas no las libere al levantar la app.
+Usar siempre contra una base de pruebas: --truncate vacía usuarios, rifas,
+tickets y ganadores.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, func, insert, select, text, update  # noqa: E402
+
+from database import engine, init_db  # noqa: E402
+from models import User, Raffle, Ticket, Winner, TicketStatus  # noqa: E402
+
+MAX_TICKETS_PER_RAFFLE = 1000
+USER_COLUMNS = ("id", "name", "phone", "email", "created_at")
+RAFFLE_COLUMNS = (
+    "id", "title", "description", "total_tickets", "tickets_sold", "tickets_reserved", "ticket_price",
+    "prize_first", "prize_second", "prize_third", "is_active", "is_completed", "draw_date", "created_at", "version"
+)
+TICKET_COLUMNS = (
+    "id", "ticket_number", "user_id", "raffle_id", "purchase_date", "status",
+    "payment_confirmed", "payment_date", "is_winner"
+)
+WINNER_COLUMNS = (
+    "id", "user_id", "raffle_id", "ticket_id", "prize_position", "prize_description",
+    "notified", "notification_date", "whatsapp_link", "created_at"
+)
+
+
+def _copy_value(value):
+    """Valor en el CSV de COPY: vacío sin comillas es NULL"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, TicketStatus):
+        # SQLAlchemy guarda el nombre del miembro del enum, no su valor
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+class BulkLoader:
+    """Carga filas (tuplas en el orden de `columns`) con COPY o executemany en lotes"""
+
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.use_copy = connection.dialect.name == "postgresql"
+        self.rows_loaded = {}
+
+    def load(self, model, columns, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(model, columns, batch)
+                batch = []
+        if batch:
+            self._flush(model, columns, batch)
+
+    def _flush(self, model, columns, batch):
+        table = model.__table__
+        if self.use_copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([_copy_value(value) for value in row])
+            buffer.seek(0)
+            cursor = self.connection.connection.cursor()
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.close()
+        else:
+            self.connection.execute(insert(table), [dict(zip(columns, row)) for row in batch])
+        self.rows_loaded[table.name] = self.rows_loaded.get(table.name, 0) + len(batch)
+
+
+class DatasetGenerator:
+    """Filas deterministas a partir de una semilla; los ids empiezan tras el máximo actual"""
+
+    def __init__(self, args, first_ids):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.base_date = args.base_date
+        self.first_user, self.first_raffle, self.first_ticket, self.first_winner = first_ids
+        self.next_ticket = self.first_ticket
+        self.next_winner = self.first_winner
+        self.winners = []
+
+    def users(self):
+        for index in range(self.args.users):
+            user_id = self.first_user + index
+            email = f"usuario{user_id}@example.com" if self.rng.random() < 0.3 else None
+            created_at = self.base_date - timedelta(minutes=self.rng.randrange(60 * 24 * 365))
+            # El id hace único el teléfono aunque ya haya usuarios en la base
+            yield (user_id, f"Usuario {user_id}", f"6{user_id:011d}", email, created_at)
+
+    def raffles(self):
+        for index in range(self.args.raffles):
+            raffle_id = self.first_raffle + index
+            completed = self.rng.random() < self.args.completed_ratio
+            created_at = self.base_date - timedelta(hours=self.rng.randrange(24 * 180))
+            yield (
+                raffle_id, f"Rifa {raffle_id}", None,
+                self.rng.randrange(100, MAX_TICKETS_PER_RAFFLE + 1), 0, 0,
+                float(self.rng.choice((1, 2, 5, 10, 20))),
+                "Primer premio", "Segundo premio", "Tercer premio",
+                not completed, completed, created_at + timedelta(days=30) if completed else None, created_at, 1
+            )
+
+    def tickets(self, raffle_rows):
+        """
+        Para cada número ocupado un ticket RESERVED o PAID (las completadas solo
+        PAID), más historial PENDING/CANCELLED que no ocupa el número
+        """
+        args = self.args
+        for raffle in raffle_rows:
+            raffle_id, total_tickets, completed = raffle[0], raffle[3], raffle[11]
+            occupied = int(total_tickets * self.rng.uniform(*args.fill))
+            numbers = self.rng.sample(range(1, total_tickets + 1), occupied)
+            rows = []
+            for number in numbers:
+                user_id = self.first_user + self.rng.randrange(args.users)
+                if completed or self.rng.random() < args.paid_ratio:
+                    purchase_date = self.base_date - timedelta(minutes=self.rng.randrange(60 * 24 * 60))
+                    payment_date = purchase_date + timedelta(hours=self.rng.randrange(1, 48))
+                    rows.append([
+                        self._ticket_id(), number, user_id, raffle_id, purchase_date,
+                        TicketStatus.PAID, True, payment_date, False
+                    ])
+                else:
+                    # Reservas recientes: dentro del plazo antes de vencer
+                    purchase_date = self.base_date - timedelta(minutes=self.rng.randrange(60 * 12))
+                    rows.append([
+                        self._ticket_id(), number, user_id, raffle_id, purchase_date,
+                        TicketStatus.RESERVED, False, None, False
+                    ])
+
+                if self.rng.random() < args.history_ratio:
+                    history_status = TicketStatus.CANCELLED if self.rng.random() < 0.8 else TicketStatus.PENDING
+                    rows.append([
+                        self._ticket_id(), number, self.first_user + self.rng.randrange(args.users), raffle_id,
+                        purchase_date - timedelta(days=self.rng.randrange(1, 30)), history_status, False, None, False
+                    ])
+
+            if completed:
+                self._draw(raffle, rows)
+            yield from rows
+
+    def _draw(self, raffle, rows):
+        """Hasta tres ganadores de usuarios distintos entre los tickets pagados"""
+        candidates = [row for row in rows if row[5] == TicketStatus.PAID]
+        self.rng.shuffle(candidates)
+        chosen_users = set()
+        position = 1
+        draw_date = raffle[12]
+        for ticket in candidates:
+            if position > 3:
+                break
+            if ticket[2] in chosen_users:
+                continue
+            chosen_users.add(ticket[2])
+            ticket[8] = True
+            self.winners.append((
+                self.next_winner, ticket[2], raffle[0], ticket[0], position, raffle[6 + position],
+                self.rng.random() < 0.7, draw_date + timedelta(hours=1), None, draw_date
+            ))
+            self.next_winner += 1
+            position += 1
+
+    def _ticket_id(self):
+        ticket_id = self.next_ticket
+        self.next_ticket += 1
+        return ticket_id
+
+
+def _truncate(connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("TRUNCATE winners, tickets, raffles, users RESTART IDENTITY CASCADE"))
+    else:
+        for table in ("winners", "tickets", "raffles", "users"):
+            connection.execute(text(f"DELETE FROM {table}"))
+
+
+def _next_ids(connection):
+    return tuple(
+        (connection.scalar(select(func.max(model.id))) or 0) + 1
+        for model in (User, Raffle, Ticket, Winner)
+    )
+
+
+def _recount_raffles(connection, first_raffle, last_raffle):
+    """tickets_sold / tickets_reserved desde los tickets, igual que el barrido de reservas"""
+    def count(status):
+        return (
+            select(func.count(Ticket.id))
+            .where(Ticket.raffle_id == Raffle.id, Ticket.status == status)
+            .scalar_subquery()
+        )
+
+    connection.execute(
+        update(Raffle)
+        .where(and_(Raffle.id >= first_raffle, Raffle.id <= last_raffle))
+        .values(tickets_sold=count(TicketStatus.PAID), tickets_reserved=count(TicketStatus.RESERVED))
+    )
+
+
+def _reset_sequences(connection):
+    """Con ids explícitos, las secuencias de PostgreSQL quedan atrás del máximo"""
+    if connection.dialect.name != "postgresql":
+        return
+    for table in ("users", "raffles", "tickets", "winners"):
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}), (SELECT COUNT(*) > 0 FROM {table}))"
+        ))
+
+
+def main(args):
+    init_db()
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        if args.truncate:
+            _truncate(connection)
+
+        generator = DatasetGenerator(args, _next_ids(connection))
+        loader = BulkLoader(connection, args.batch_size)
+
+        loader.load(User, USER_COLUMNS, generator.users())
+        raffle_rows = list(generator.raffles())
+        loader.load(Raffle, RAFFLE_COLUMNS, raffle_rows)
+        loader.load(Ticket, TICKET_COLUMNS, generator.tickets(raffle_rows))
+        loader.load(Winner, WINNER_COLUMNS, generator.winners)
+
+        if raffle_rows:
+            _recount_raffles(connection, raffle_rows[0][0], raffle_rows[-1][0])
+        _reset_sequences(connection)
+
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        connection.commit()
+
+    method = "COPY" if loader.use_copy else "executemany"
+    print(f"Cargado con {method} en {time.perf_counter() - start:.1f} s:")
+    for table, rows in loader.rows_loaded.items():
+        print(f"  {table:<8} {rows:>10}")
+
+
+def _parse_range(value):
+    low, high = (float(part) for part in value.split(","))
+    return low, high
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-date", type=datetime.fromisoformat,
+                        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help="Fecha de referencia de los datos (ISO), por defecto hoy a medianoche UTC")
+    parser.add_argument("--raffles", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--fill", type=_parse_range, default=(0.3, 1.0),
+                        help="Fracción de números ocupados por rifa, como rango 'min,max'")
+    parser.add_argument("--paid-ratio", type=float, default=0.85, help="Fracción de ocupados ya pagados")
+    parser.add_argument("--history-ratio", type=float, default=0.1,
+                        help="Probabilidad de un ticket PENDING/CANCELLED previo por número")
+    parser.add_argument("--completed-ratio", type=float, default=0.3, help="Fracción de rifas completadas con ganadores")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--truncate", action="store_true", help="Vaciar usuarios, rifas, tickets y ganadores antes")
+    main(parser.parse_args())
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import logging
+import time
+
+from config import settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Caché en memoria con expiración por entrada"""
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        if len(self._entries) >= self.maxsize and key not in self._entries:
+            self._evict_expired()
+            if len(self._entries) >= self.maxsize:
+                # Descartar la entrada más antigua
+                self._entries.pop(next(iter(self._entries)))
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+
+# Resumen de /stats/overview; lo invalidan compras, pagos, sorteos y expiraciones
+stats_cache = TTLCache(settings.STATS_CACHE_TTL_SECONDS, maxsize=1)
+
+
+class LRUBackend:
+    """Backend en memoria del proceso: LRU acotado con expiración por entrada"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float):
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Backend compartido entre workers. Requiere el paquete redis (opcional);
+    las invalidaciones de un worker se ven en todos.
+    """
+
+    def __init__(self, url: str, prefix: str = "raffle:response:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requiere instalar el paquete redis")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float):
+        await self._client.set(self.prefix + key, value, px=int(ttl_seconds * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*(self.prefix + key for key in keys))
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=self.prefix + "*"):
+            await self._client.delete(key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class ResponseCache:
+    """
+    Cuerpos JSON ya serializados de las rutas públicas de lectura, junto con su
+    ETag. Las rutas de escritura eliminan las claves afectadas; el TTL solo
+    acota lo que otro worker puede ver desactualizado con el backend en memoria.
+    El backend es intercambiable (por ejemplo por uno falso en pruebas).
+    """
+
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+        # Aumenta con cada invalidación; evita guardar una respuesta armada
+        # antes de una escritura que terminó mientras se consultaba la base
+        self.generation = 0
+
+    async def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """Devuelve (etag, cuerpo) o None"""
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            metrics.response_cache_errors.inc()
+            logger.warning(f"Error leyendo caché de respuestas: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            metrics.response_cache_lookups.inc(result="miss")
+            return None
+        self.hits += 1
+        metrics.response_cache_lookups.inc(result="hit")
+        etag, _, body = value.partition(b"\n")
+        return etag.decode(), body
+
+    async def set(self, key: str, etag: str, body: bytes, generation: int):
+        if generation != self.generation:
+            return
+        try:
+            await self.backend.set(key, etag.encode() + b"\n" + body, self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            metrics.response_cache_errors.inc()
+            logger.warning(f"Error escribiendo caché de respuestas: {e}")
+
+    async def invalidate(self, *keys: str):
+        self.invalidations += 1
+        metrics.response_cache_invalidations.inc()
+        self.generation += 1
+        try:
+            await self.backend.delete(*keys)
+        except Exception as e:
+            self.errors += 1
+            metrics.response_cache_errors.inc()
+            logger.warning(f"Error invalidando caché de respuestas: {e}")
+
+    def as_dict(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "ttl_seconds": self.ttl_seconds,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+            "invalidations": self.invalidations,
+            "errors": self.errors
+        }
+
+
+def build_response_backend():
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(settings.RESPONSE_CACHE_REDIS_URL)
+    return LRUBackend(settings.RESPONSE_CACHE_MAXSIZE)
+
+
+# Catálogo público de rifas (/raffles/ y /raffles/{id})
+response_cache = ResponseCache(build_response_backend(), settings.RESPONSE_CACHE_TTL_SECONDS)
+metrics.registry.gauge(
+    "raffle_response_cache_entries", "Respuestas guardadas en la caché en memoria", lambda: response_cache.backend.size()
+)
+
+
+def raffle_list_key(active_only: bool) -> str:
+    return f"raffles:active={int(active_only)}"
+
+
+def raffle_key(raffle_id: int) -> str:
+    return f"raffle:{raffle_id}"
+
+
+async def invalidate_raffle_catalogue(*raffle_ids: int):
+    """Lo llaman las escrituras que cambian rifas o sus contadores"""
+    await response_cache.invalidate(
+        raffle_list_key(True),
+        raffle_list_key(False),
+        *(raffle_key(raffle_id) for raffle_id in raffle_ids)
+    )
@@ -1,14 +1,22 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from config import settings
+from typing import Optional
+import asyncio
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 from models import Base
+from migrations import run_migrations
+from cache import TTLCache
+import metrics
+import sqltrace
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -25,26 +33,153 @@ def get_database_url():
     else:
         return settings.DATABASE_URL
 
+def get_async_database_url(database_url: str) -> str:
+    """Convierte la URL síncrona en la del driver async (asyncpg / aiosqlite)"""
+    if database_url.startswith("postgresql://"):
+        # asyncpg recibe el modo SSL como "ssl" en lugar de "sslmode"
+        database_url = database_url.replace("sslmode=", "ssl=")
+        return database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if database_url.startswith("sqlite://"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return database_url
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Pool async que registra cuánto tarda cada checkout en obtener una conexión"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - start)
+
 # Configurar engine para PostgreSQL
 database_url = get_database_url()
+async_database_url = get_async_database_url(database_url)
+is_sqlite = database_url.startswith("sqlite")
 
-# Configuración específica para PostgreSQL
-engine = create_engine(
-    database_url,
-    poolclass=QueuePool,  # Usar QueuePool para PostgreSQL
-    pool_size=5,  # Número de conexiones en el pool
-    max_overflow=10,  # Máximo de conexiones adicionales
-    pool_pre_ping=True,  # Verificar conexión antes de usar
-    pool_recycle=300,  # Reciclar conexiones cada 300 segundos
-    echo=False,  # Cambiar a True para debug
-    connect_args={
-        "connect_timeout": 10,
-        "keepalives": 1,
-        "keepalives_idle": 30,
-        "keepalives_interval": 10,
-        "keepalives_count": 5,
+if is_sqlite:
+    # SQLite solo se usa para pruebas locales y benchmarks
+    engine = create_engine(database_url, echo=False)
+    async_engine = create_async_engine(async_database_url, echo=False)
+else:
+    pool_options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    
+    # Engine síncrono: scripts e inicialización (init_db)
+    engine = create_engine(
+        database_url,
+        poolclass=QueuePool,  # Usar QueuePool para PostgreSQL
+        echo=False,  # Cambiar a True para debug
+        connect_args={
+            "connect_timeout": 10,
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 5,
+        },
+        **pool_options
+    )
+    
+    # Engine async: todas las rutas de la API
+    async_engine = create_async_engine(
+        async_database_url,
+        poolclass=TimedAsyncQueuePool,
+        echo=False,
+        connect_args={
+            "timeout": 10,
+        },
+        **pool_options
+    )
+
+# Conteo y tiempo de consultas por petición, y log de consultas lentas
+sqltrace.install(engine)
+sqltrace.install(async_engine.sync_engine)
+
+def _pool_stat(name: str):
+    """Lectura para /metrics; None si el pool no la soporta (NullPool en SQLite)"""
+    def read():
+        stat = getattr(async_engine.pool, name, None)
+        return stat() if callable(stat) else None
+    return read
+
+metrics.registry.gauge("raffle_db_pool_size", "Tamaño configurado del pool async", _pool_stat("size"))
+metrics.registry.gauge("raffle_db_pool_checked_out", "Conexiones del pool async en uso", _pool_stat("checkedout"))
+metrics.registry.gauge("raffle_db_pool_checked_in", "Conexiones libres en el pool async", _pool_stat("checkedin"))
+
+def _pool_overflow():
+    """QueuePool.overflow() arranca en -pool_size; solo interesan las conexiones extra"""
+    overflow = _pool_stat("overflow")()
+    return None if overflow is None else max(overflow, 0)
+
+metrics.registry.gauge("raffle_db_pool_overflow", "Conexiones abiertas por encima de pool_size", _pool_overflow)
+
+def pool_status() -> Optional[dict]:
+    """Uso del pool async; None si no hay pool (NullPool en SQLite)"""
+    pool = async_engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    capacity = settings.DB_POOL_SIZE + max(settings.DB_MAX_OVERFLOW, 0)
+    checked_out = pool.checkedout()
+    return {
+        "size": pool.size(),
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else 0,
     }
-)
+
+async def warm_pool() -> int:
+    """Abre las conexiones mínimas del pool antes de recibir tráfico"""
+    if not isinstance(async_engine.pool, QueuePool):
+        return 0
+    # Se abren todas a la vez y se mantienen hasta el final para que el pool
+    # no reutilice la misma conexión
+    connections = await asyncio.gather(
+        *(async_engine.connect() for _ in range(settings.DB_POOL_SIZE)),
+        return_exceptions=True
+    )
+    opened = [connection for connection in connections if not isinstance(connection, BaseException)]
+    errors = [error for error in connections if isinstance(error, BaseException)]
+    for connection in opened:
+        await connection.close()
+    if errors:
+        logger.warning(f"No se pudieron abrir {len(errors)} conexiones al precalentar el pool: {errors[0]!r}")
+    return len(opened)
+
+# Último resultado del SELECT 1 de /health; evita que cada sondeo del balanceador
+# ocupe una conexión
+_health_cache = TTLCache(settings.HEALTH_DB_CACHE_SECONDS, maxsize=1)
+_health_lock = asyncio.Lock()
+
+async def _select_one():
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+async def check_database() -> dict:
+    """SELECT 1 con límite de tiempo, cacheado HEALTH_DB_CACHE_SECONDS"""
+    result = _health_cache.get("database")
+    if result is not None:
+        return result
+    async with _health_lock:
+        result = _health_cache.get("database")
+        if result is not None:
+            return result
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(_select_one(), settings.HEALTH_DB_TIMEOUT_SECONDS)
+            result = {"connected": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            logger.warning(f"Health check: la base de datos no responde: {e!r}")
+            result = {"connected": False, "latency_ms": None}
+        _health_cache.set("database", result)
+        return result
 
 SessionLocal = sessionmaker(
     autocommit=False, 
@@ -53,14 +188,33 @@ SessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
-def get_db():
-    """Dependency para obtener sesión de base de datos"""
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+async def get_db():
+    """Dependency para obtener sesión async de base de datos"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
+    """Sesión síncrona para scripts y tareas fuera del event loop"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def dialect_insert(bind):
+    """Devuelve la construcción insert del dialecto (soporta ON CONFLICT y RETURNING)"""
+    if bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
 def create_default_admin():
     """Crear administrador por defecto si no existe"""
     from models import Admin
@@ -96,11 +250,14 @@ def create_default_admin():
         db.close()
 
 def init_db():
-    """Inicializar la base de datos (crear tablas)"""
+    """Inicializar la base de datos (crear tablas y aplicar migraciones)"""
     try:
         Base.metadata.create_all(bind=engine)
         logger.info("Tablas de base de datos creadas exitosamente")
         
+        # Cambios de esquema sobre tablas existentes (índices, columnas)
+        run_migrations(engine)
+        
         # Crear admin por defecto
         create_default_admin()
         
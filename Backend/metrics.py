@@ -0,0 +1,237 @@
+"""
+Métricas en formato de texto de Prometheus, sin dependencias externas.
+
+Contadores, histogramas y gauges con etiquetas, un middleware ASGI que mide
+cada ruta y el registro que /metrics serializa. Todo se actualiza desde el
+event loop, así que no hace falta sincronización.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import time
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Valor que sube y baja, o que se lee al exportar si se pasa `read`"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Optional[Callable[[], Optional[float]]] = None):
+        super().__init__(name, documentation)
+        self._read = read
+        self._value = 0
+
+    def inc(self, amount: float = 1):
+        self._value += amount
+
+    def dec(self, amount: float = 1):
+        self._value -= amount
+
+    def samples(self) -> List[str]:
+        value = self._read() if self._read else self._value
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Por combinación de etiquetas: cuentas por bucket (no acumuladas), suma y total
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        if not self.labelnames:
+            self._series[()] = ([0] * (len(self.buckets) + 1), [0.0])
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Optional[Callable[[], Optional[float]]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests = registry.counter(
+    "raffle_http_requests_total", "Peticiones HTTP por ruta, método y código", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "raffle_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route")
+)
+
+# Base de datos
+db_pool_wait = registry.histogram(
+    "raffle_db_pool_wait_seconds",
+    "Tiempo hasta obtener una conexión del pool async (espera más apertura de conexiones nuevas)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+
+# Caché de respuestas del catálogo
+response_cache_lookups = registry.counter(
+    "raffle_response_cache_lookups_total", "Lecturas de la caché de respuestas por resultado", ("result",)
+)
+response_cache_invalidations = registry.counter("raffle_response_cache_invalidations_total", "Invalidaciones de la caché de respuestas")
+response_cache_errors = registry.counter("raffle_response_cache_errors_total", "Errores del backend de la caché de respuestas")
+
+# Socket.IO
+socketio_clients = registry.gauge("raffle_socketio_connected_clients", "Clientes Socket.IO conectados a este proceso")
+socketio_connections = registry.counter("raffle_socketio_connections_total", "Conexiones Socket.IO aceptadas")
+socketio_emits = registry.counter("raffle_socketio_emits_total", "Eventos emitidos por el servidor", ("event",))
+
+# Negocio
+tickets_reserved = registry.counter("raffle_tickets_reserved_total", "Boletos reservados por compras")
+tickets_paid = registry.counter("raffle_tickets_paid_total", "Boletos con pago confirmado")
+tickets_expired = registry.counter("raffle_tickets_expired_total", "Reservas liberadas por vencimiento")
+draws = registry.counter("raffle_draws_total", "Ganadores sorteados", ("mode",))
+logins = registry.counter("raffle_admin_logins_total", "Intentos de login de admins por resultado", ("result",))
+
+
+_route_paths: Dict[int, Dict[object, str]] = {}
+
+
+def route_template(scope) -> str:
+    """Plantilla de la ruta resuelta (/api/raffles/{raffle_id}) en lugar del path con ids"""
+    app = scope.get("app")
+    if app is None:
+        return scope.get("path", "sin_ruta")
+    paths = _route_paths.get(id(app))
+    if paths is None:
+        paths = _route_paths[id(app)] = {
+            route.endpoint if hasattr(route, "endpoint") else route.app: route.path
+            for route in app.routes
+        }
+    return paths.get(scope.get("endpoint"), "sin_ruta")
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide latencia y código de cada petición HTTP. Las rutas
+    se etiquetan con su plantilla para no crear una serie por id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = route_template(scope)
+            http_latency.observe(time.perf_counter() - start, method=scope["method"], route=route)
+            http_requests.inc(method=scope["method"], route=route, status=str(status_code))
@@ -0,0 +1,155 @@
+"""
+Migraciones versionadas del esquema.
+
+Base.metadata.create_all solo crea tablas que no existen: no agrega columnas
+ni índices nuevos a tablas existentes. Cada cambio de esquema sobre tablas ya
+creadas se registra aquí con un número de versión; init_db aplica las
+pendientes en orden y las anota en la tabla schema_migrations.
+
+Las migraciones deben ser idempotentes (checkfirst, IF NOT EXISTS), porque en
+una base nueva create_all ya dejó el esquema al día.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+import logging
+
+from models import Base, ACTIVE_TICKET_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Clave arbitraria para serializar migraciones entre procesos en PostgreSQL
+MIGRATION_LOCK_KEY = 727301
+
+migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def create_indexes(*index_names: str) -> Callable[[Connection], None]:
+    """Migración que crea índices declarados en los modelos si faltan"""
+    def migrate(connection: Connection):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in index_names:
+                    index.create(bind=connection, checkfirst=True)
+    return migrate
+
+
+def add_columns(table_name: str, *column_names: str) -> Callable[[Connection], None]:
+    """Migración que agrega a una tabla existente columnas declaradas en los modelos"""
+    def migrate(connection: Connection):
+        table = Base.metadata.tables[table_name]
+        existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+        for name in column_names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            ddl = f"ALTER TABLE {table_name} ADD COLUMN {name} {column.type.compile(connection.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            connection.execute(text(ddl))
+    return migrate
+
+
+def drop_indexes(*index_names: str) -> Callable[[Connection], None]:
+    """Migración que elimina índices reemplazados por otros"""
+    def migrate(connection: Connection):
+        for name in index_names:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return migrate
+
+
+def ensure_unique(table_name: str, *column_names: str, where: Optional[str] = None) -> Callable[[Connection], None]:
+    """
+    Falla con un mensaje claro si hay duplicados que impiden crear un índice
+    único; `where` limita la revisión a las filas que cubre un índice parcial
+    """
+    def migrate(connection: Connection):
+        columns = ", ".join(column_names)
+        condition = f" WHERE {where}" if where else ""
+        duplicates = connection.execute(text(
+            f"SELECT {columns}, COUNT(*) FROM {table_name}{condition} "
+            f"GROUP BY {columns} HAVING COUNT(*) > 1 ORDER BY {columns}"
+        )).all()
+        if duplicates:
+            listed = ", ".join(f"{tuple(row[:-1])} x{row[-1]}" for row in duplicates)
+            raise RuntimeError(
+                f"Filas duplicadas en {table_name} ({columns}){condition}: {listed}. "
+                "Resolverlas a mano antes de aplicar la migración"
+            )
+    return migrate
+
+
+def steps(*migrations: Callable[[Connection], None]) -> Callable[[Connection], None]:
+    """Agrupa varias operaciones en una sola migración"""
+    def migrate(connection: Connection):
+        for migration in migrations:
+            migration(connection)
+    return migrate
+
+
+# SQLAlchemy guarda en la columna el nombre del miembro del enum
+_ACTIVE_TICKETS = "status IN ({})".format(", ".join(f"'{status.name}'" for status in ACTIVE_TICKET_STATUSES))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    # Con la compra anterior (verificar y luego insertar) una carrera podía
+    # vender dos veces el mismo número: se revisa antes de crear el índice
+    (1, "Índice único parcial de números activos por rifa",
+     steps(
+         ensure_unique("tickets", "raffle_id", "ticket_number", where=_ACTIVE_TICKETS),
+         create_indexes("uq_tickets_raffle_number_active"),
+     )),
+    (2, "Índices compuestos de tickets y winners",
+     create_indexes(
+         "ix_tickets_raffle_status",
+         "ix_tickets_user_id",
+         "ix_tickets_status_payment",
+         "ix_tickets_status_purchase_date",
+         "ix_winners_raffle_position",
+     )),
+    (3, "Índices (raffle_id, id) y (user_id, id) para paginación por cursor",
+     steps(
+         create_indexes("ix_tickets_raffle_id_id", "ix_tickets_user_id_id"),
+         drop_indexes("ix_tickets_user_id"),
+     )),
+    (4, "Columna raffles.version para ETag", add_columns("raffles", "version")),
+    (5, "Índice único de ganador por rifa y posición",
+     steps(
+         ensure_unique("winners", "raffle_id", "prize_position"),
+         drop_indexes("ix_winners_raffle_position"),
+         create_indexes("ix_winners_raffle_position"),
+     )),
+]
+
+
+def run_migrations(engine: Engine):
+    """Aplica en orden las migraciones que aún no figuran en schema_migrations"""
+    migrations_metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Con varios workers arrancando a la vez solo uno migra
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+        applied = set(connection.scalars(select(schema_migrations.c.version)))
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Aplicando migración {version}: {description}")
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
@@ -1,11 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, Enum as SQLAlchemyEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
-import bcrypt
 import enum
 import logging
 
+from passwords import hash_password, check_password
+
 Base = declarative_base()
 logger = logging.getLogger(__name__)
 
@@ -15,6 +16,9 @@ class TicketStatus(enum.Enum):
     PAID = "paid"
     CANCELLED = "cancelled"
 
+# Estados en los que un ticket ocupa su número dentro de la rifa
+ACTIVE_TICKET_STATUSES = (TicketStatus.RESERVED, TicketStatus.PAID)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -44,6 +48,8 @@ class Raffle(Base):
     is_completed = Column(Boolean, default=False)
     draw_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Aumenta con cada compra, pago, expiración, sorteo o cierre; base de los ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     tickets = relationship("Ticket", back_populates="raffle", cascade="all, delete-orphan")
     winners = relationship("Winner", back_populates="raffle", cascade="all, delete-orphan")
@@ -63,6 +69,27 @@ class Ticket(Base):
     
     user = relationship("User", back_populates="tickets")
     raffle = relationship("Raffle", back_populates="tickets")
+    
+    __table_args__ = (
+        # Un número solo puede estar reservado o pagado una vez por rifa
+        Index(
+            "uq_tickets_raffle_number_active",
+            "raffle_id",
+            "ticket_number",
+            unique=True,
+            postgresql_where=status.in_(ACTIVE_TICKET_STATUSES),
+            sqlite_where=status.in_(ACTIVE_TICKET_STATUSES),
+        ),
+        # Compras, mapa de ocupación y sorteo filtran por rifa y estado
+        Index("ix_tickets_raffle_status", "raffle_id", "status"),
+        # Paginación por cursor (id) dentro de una rifa o de un usuario
+        Index("ix_tickets_raffle_id_id", "raffle_id", "id"),
+        Index("ix_tickets_user_id_id", "user_id", "id"),
+        # Pagos pendientes (/tickets/pending)
+        Index("ix_tickets_status_payment", "status", "payment_confirmed"),
+        # Barrido de reservas vencidas
+        Index("ix_tickets_status_purchase_date", "status", "purchase_date"),
+    )
 
 class Winner(Base):
     __tablename__ = "winners"
@@ -81,6 +108,11 @@ class Winner(Base):
     user = relationship("User", back_populates="wins")
     raffle = relationship("Raffle", back_populates="winners")
     ticket = relationship("Ticket")
+    
+    __table_args__ = (
+        # Un solo ganador por posición y rifa, aun con sorteos simultáneos
+        Index("ix_winners_raffle_position", "raffle_id", "prize_position", unique=True),
+    )
 
 class Admin(Base):
     __tablename__ = "admins"
@@ -95,15 +127,12 @@ class Admin(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     def set_password(self, password: str):
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+        # Síncrono: para scripts. Las rutas usan password_pool (passwords.py)
+        self.password_hash = hash_password(password)
     
     def verify_password(self, password: str) -> bool:
-        password_bytes = password.encode('utf-8')
         try:
-            hash_bytes = self.password_hash.encode('utf-8')
-            result = bcrypt.checkpw(password_bytes, hash_bytes)
+            result = check_password(password, self.password_hash)
             logger.debug(f"Verificación de contraseña para {self.username}: {result}")
             return result
         except Exception as e:
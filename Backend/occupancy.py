@@ -0,0 +1,171 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+
+from models import Raffle, Ticket, TicketStatus, ACTIVE_TICKET_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+# Estado de cada número en el mapa (2 bits)
+FREE = 0
+RESERVED = 1
+PAID = 2
+
+STATE_NAMES = {FREE: "free", RESERVED: "reserved", PAID: "paid"}
+
+
+class TicketMap:
+    """
+    Estado de cada número de una rifa empaquetado a 2 bits: el número n ocupa
+    los bits 2*((n-1) % 4) y siguiente del byte (n-1) // 4. Así una rifa de
+    100.000 números cabe en 25 KB y se puede enviar tal cual al cliente.
+    `version` es la Raffle.version que el mapa refleja.
+    """
+
+    __slots__ = ("total_tickets", "version", "_states")
+
+    def __init__(self, total_tickets: int, version: int = 0):
+        self.total_tickets = total_tickets
+        self.version = version
+        self._states = bytearray((total_tickets + 3) >> 2)
+
+    def _in_range(self, number: int) -> bool:
+        return 1 <= number <= self.total_tickets
+
+    def state(self, number: int) -> int:
+        if not self._in_range(number):
+            return FREE
+        index = number - 1
+        return (self._states[index >> 2] >> ((index & 3) << 1)) & 3
+
+    def is_occupied(self, number: int) -> bool:
+        return self.state(number) != FREE
+
+    def occupied_among(self, numbers: Iterable[int]) -> List[int]:
+        """Devuelve los números de la lista que ya están reservados o pagados"""
+        return [number for number in numbers if self.is_occupied(number)]
+
+    def set_state(self, numbers: Iterable[int], state: int):
+        for number in numbers:
+            if self._in_range(number):
+                index = number - 1
+                shift = (index & 3) << 1
+                self._states[index >> 2] = (self._states[index >> 2] & ~(3 << shift) & 0xFF) | (state << shift)
+
+    def packed(self) -> bytes:
+        """Copia del arreglo empaquetado, para enviarlo al cliente"""
+        return bytes(self._states)
+
+
+class OccupancyRegistry:
+    """
+    Mapas de estado por rifa activa. Se construyen de forma perezosa desde la
+    tabla tickets la primera vez que se necesitan (por ejemplo tras un reinicio)
+    y luego se mantienen al día con compras, confirmaciones y expiraciones.
+    Sirven tanto para descartar compras de números ocupados como para el
+    endpoint /raffles/{id}/ticket-map.
+
+    Con varios workers cada proceso solo ve sus propios cambios. Por eso cada
+    mapa guarda la Raffle.version que refleja: un cambio local lo adelanta
+    solo si es el siguiente de esa versión (el RETURNING version del UPDATE),
+    y get() lo reconstruye cuando la rifa leída de la base va por delante.
+
+    Todas las operaciones se hacen desde el event loop, así que solo la
+    construcción (que espera a la base de datos) necesita coordinación.
+    """
+
+    def __init__(self):
+        self._maps: Dict[int, TicketMap] = {}
+        # Cambios recibidos mientras se construye un mapa; se aplican al publicarlo
+        self._pending: Dict[int, List[Tuple[int, List[int], Optional[int], Optional[int]]]] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _is_current(ticket_map: Optional[TicketMap], raffle: Raffle) -> bool:
+        return (
+            ticket_map is not None
+            and ticket_map.total_tickets == raffle.total_tickets
+            and ticket_map.version >= raffle.version
+        )
+
+    async def get(self, db: AsyncSession, raffle: Raffle) -> TicketMap:
+        ticket_map = self._maps.get(raffle.id)
+        if self._is_current(ticket_map, raffle):
+            return ticket_map
+
+        async with self._lock:
+            ticket_map = self._maps.get(raffle.id)
+            if not self._is_current(ticket_map, raffle):
+                self._pending[raffle.id] = []
+                try:
+                    ticket_map = await self._build(db, raffle)
+                    for state, numbers, version, previous in self._pending[raffle.id]:
+                        self._update(ticket_map, state, numbers, version, previous)
+                finally:
+                    del self._pending[raffle.id]
+                self._maps[raffle.id] = ticket_map
+            return ticket_map
+
+    async def _build(self, db: AsyncSession, raffle: Raffle) -> TicketMap:
+        # La versión se lee antes que los tickets: el mapa refleja al menos esa
+        # versión (si es más nuevo, solo provoca una reconstrucción de más)
+        version = await db.scalar(select(Raffle.version).where(Raffle.id == raffle.id))
+        ticket_map = TicketMap(raffle.total_tickets, version or 0)
+        rows = (await db.execute(
+            select(Ticket.ticket_number, Ticket.status).where(
+                Ticket.raffle_id == raffle.id,
+                Ticket.status.in_(ACTIVE_TICKET_STATUSES)
+            )
+        )).all()
+        ticket_map.set_state([number for number, status in rows if status == TicketStatus.RESERVED], RESERVED)
+        ticket_map.set_state([number for number, status in rows if status == TicketStatus.PAID], PAID)
+        logger.info(f"Mapa de ocupación construido para rifa {raffle.id}: {len(rows)} números ocupados")
+        return ticket_map
+
+    @staticmethod
+    def _update(ticket_map: TicketMap, state: Optional[int], numbers: List[int],
+                version: Optional[int], previous: Optional[int]):
+        if state is not None:
+            ticket_map.set_state(numbers, state)
+        if version is not None and ticket_map.version == (version - 1 if previous is None else previous):
+            ticket_map.version = version
+
+    def _apply(self, raffle_id: int, state: Optional[int], numbers: Iterable[int],
+               version: Optional[int] = None, previous: Optional[int] = None):
+        numbers = list(numbers)
+        if raffle_id in self._pending:
+            self._pending[raffle_id].append((state, numbers, version, previous))
+        ticket_map = self._maps.get(raffle_id)
+        if ticket_map is not None:
+            self._update(ticket_map, state, numbers, version, previous)
+
+    # `version` es la Raffle.version que dejó el cambio ya confirmado y
+    # `previous` la que tenía antes (por defecto version - 1). Sin version el
+    # cambio es solo una pista y el mapa no se da por actualizado.
+
+    def reserve(self, raffle_id: int, numbers: Iterable[int], version: Optional[int] = None):
+        """Marca números como reservados. No hace nada si el mapa no está cargado"""
+        self._apply(raffle_id, RESERVED, numbers, version)
+
+    def mark_paid(self, raffle_id: int, numbers: Iterable[int], version: Optional[int] = None):
+        """Marca números como pagados"""
+        self._apply(raffle_id, PAID, numbers, version)
+
+    def release(self, raffle_id: int, numbers: Iterable[int], version: Optional[int] = None,
+                previous: Optional[int] = None):
+        """Libera números (reserva expirada o cancelada)"""
+        self._apply(raffle_id, FREE, numbers, version, previous)
+
+    def advance(self, raffle_id: int, version: int):
+        """Cambio de la rifa que no altera el estado de los números (sorteo, notificación)"""
+        self._apply(raffle_id, None, (), version)
+
+    def discard(self, raffle_id: int):
+        """Olvida el mapa de una rifa que deja de estar activa"""
+        self._maps.pop(raffle_id, None)
+
+
+occupancy = OccupancyRegistry()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bcrypt
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordPoolBusy(Exception):
+    """La cola de verificaciones bcrypt está llena"""
+
+
+def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+class PasswordPool:
+    """
+    Pool acotado para bcrypt. bcrypt libera el GIL, así que unos pocos hilos
+    dedicados bastan; lo importante es que un aluvión de logins no ocupe el
+    threadpool de Starlette ni forme una cola ilimitada.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.capacity = workers + max_pending
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def is_saturated(self) -> bool:
+        return self.in_flight >= self.capacity
+
+    def check_admission(self):
+        """Lanza PasswordPoolBusy (y lo cuenta) si no hay lugar para otra verificación"""
+        if self.is_saturated():
+            self.rejected += 1
+            raise PasswordPoolBusy()
+
+    async def run(self, fn, *args):
+        self.check_admission()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        try:
+            return await self.run(check_password, password, password_hash)
+        except PasswordPoolBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Error verificando contraseña: {e}")
+            return False
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_pool = PasswordPool(settings.BCRYPT_WORKERS, settings.BCRYPT_MAX_PENDING)
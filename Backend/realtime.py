@@ -0,0 +1,260 @@
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+import random
+import socketio
+import logging
+import time
+
+from config import settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+def build_client_manager() -> Optional[socketio.AsyncManager]:
+    """
+    Con un solo worker basta el administrador en memoria de python-socketio.
+    Con varios workers o nodos, SOCKETIO_MESSAGE_QUEUE apunta a un broker
+    compartido y cada emit llega a los clientes conectados a cualquier proceso
+    (y el balanceador necesita sesiones pegajosas para el long-polling).
+    """
+    url = settings.SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        if settings.WEB_CONCURRENCY > 1:
+            # Cada worker solo avisaría a sus propios clientes
+            raise RuntimeError(
+                f"WEB_CONCURRENCY={settings.WEB_CONCURRENCY} requiere SOCKETIO_MESSAGE_QUEUE; "
+                "configure la cola o use un solo worker"
+            )
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # Requiere el paquete redis
+        manager = socketio.AsyncRedisManager(url, channel=settings.SOCKETIO_CHANNEL)
+    elif url.startswith("amqp://"):
+        # Requiere el paquete aio_pika
+        manager = socketio.AsyncAioPikaManager(url, channel=settings.SOCKETIO_CHANNEL)
+    else:
+        raise ValueError(f"SOCKETIO_MESSAGE_QUEUE no soportada: {url}")
+    logger.info(f"Socket.IO usando cola de mensajes compartida ({url.split('://')[0]})")
+    return manager
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros INFO/DEBUG; advertencias y errores siempre"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def build_sampled_logger(name: str, rate: float) -> logging.Logger:
+    sampled = logging.getLogger(name)
+    sampled.setLevel(logging.INFO if rate > 0 else logging.WARNING)
+    sampled.addFilter(SamplingFilter(rate))
+    return sampled
+
+
+# Servidor Socket.IO compartido por la app, las rutas y las tareas en segundo plano.
+# Con miles de espectadores registrar cada evento y paquete satura los logs,
+# así que solo se conserva una muestra configurable
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    client_manager=build_client_manager(),
+    cors_allowed_origins="*",
+    logger=build_sampled_logger("socketio.events", settings.SOCKETIO_LOG_SAMPLE_RATE),
+    engineio_logger=build_sampled_logger("engineio.packets", settings.ENGINEIO_LOG_SAMPLE_RATE)
+)
+
+
+async def emit(event: str, data, **kwargs):
+    """sio.emit contando los eventos enviados para /metrics"""
+    metrics.socketio_emits.inc(event=event)
+    await sio.emit(event, data, **kwargs)
+
+
+def raffle_room(raffle_id: int) -> str:
+    return f"raffle:{raffle_id}"
+
+
+class RaffleUpdateBroadcaster:
+    """
+    Agrupa los cambios de contadores y números de cada rifa durante una ventana
+    corta y emite un solo 'raffle_update' por rifa al room raffle:{id}. Una
+    ráfaga de cientos de compras se convierte en unos pocos mensajes.
+
+    Para cada número se envía solo su último estado dentro de la ventana.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._pending: Dict[int, Dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        raffle_id: int,
+        sold_delta: int = 0,
+        reserved_delta: int = 0,
+        numbers: Iterable[int] = (),
+        state: str = "reserved"
+    ):
+        entry = self._pending.setdefault(raffle_id, {"sold": 0, "reserved": 0, "numbers": {}})
+        entry["sold"] += sold_delta
+        entry["reserved"] += reserved_delta
+        for number in numbers:
+            entry["numbers"][number] = state
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window_seconds)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for raffle_id, entry in pending.items():
+            grouped = {"reserved": [], "paid": [], "free": []}
+            for number, state in sorted(entry["numbers"].items()):
+                grouped[state].append(number)
+            try:
+                await emit('raffle_update', {
+                    "raffle_id": raffle_id,
+                    "tickets_sold_delta": entry["sold"],
+                    "tickets_reserved_delta": entry["reserved"],
+                    "reserved_numbers": grouped["reserved"],
+                    "paid_numbers": grouped["paid"],
+                    "released_numbers": grouped["free"]
+                }, room=raffle_room(raffle_id))
+            except Exception as e:
+                logger.error(f"Error emitiendo actualización de rifa {raffle_id}: {e}")
+
+    async def close(self):
+        """Envía lo pendiente al apagar la app"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+raffle_updates = RaffleUpdateBroadcaster(settings.REALTIME_COALESCE_SECONDS)
+
+
+class LatestEventRelay:
+    """
+    Reenvía un evento de alta frecuencia (cuadros del giro de la ruleta) al
+    room de su rifa como máximo una vez por intervalo. Lo que llega entre
+    envíos se descarta salvo el último, que sale al cerrar el intervalo; así
+    el costo es O(rifas × cuadros por segundo) sin importar cuántos eventos
+    mande el cliente.
+    """
+
+    def __init__(self, event: str, interval_seconds: float):
+        self.event = event
+        self.interval_seconds = interval_seconds
+        self._last_sent: Dict[int, float] = {}
+        self._latest: Dict[int, Tuple[Dict, Optional[str]]] = {}
+        self._scheduled: Dict[int, asyncio.Task] = {}
+        self.received = 0
+        self.sent = 0
+
+    async def push(self, raffle_id: int, data: Dict, sender_sid: Optional[str] = None):
+        self.received += 1
+        self._latest[raffle_id] = (data, sender_sid)
+        if raffle_id in self._scheduled:
+            return
+        wait = self._last_sent.get(raffle_id, 0) + self.interval_seconds - time.monotonic()
+        if wait <= 0:
+            await self._send(raffle_id)
+        else:
+            self._scheduled[raffle_id] = asyncio.get_running_loop().create_task(self._send_later(raffle_id, wait))
+
+    async def _send_later(self, raffle_id: int, wait: float):
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            self._scheduled.pop(raffle_id, None)
+        await self._send(raffle_id)
+
+    async def _send(self, raffle_id: int):
+        latest = self._latest.pop(raffle_id, None)
+        if latest is None:
+            return
+        data, sender_sid = latest
+        now = time.monotonic()
+        self._prune(now)
+        self._last_sent[raffle_id] = now
+        self.sent += 1
+        await emit(self.event, data, room=raffle_room(raffle_id), skip_sid=sender_sid)
+
+    def _prune(self, now: float):
+        """Un envío más viejo que el intervalo ya no limita nada"""
+        cutoff = now - self.interval_seconds
+        for raffle_id in [raffle_id for raffle_id, sent in self._last_sent.items() if sent <= cutoff]:
+            del self._last_sent[raffle_id]
+
+    def forget(self, raffle_id: int):
+        self._last_sent.pop(raffle_id, None)
+        self._latest.pop(raffle_id, None)
+        task = self._scheduled.pop(raffle_id, None)
+        if task is not None:
+            task.cancel()
+
+
+class DrawState:
+    """
+    Estado del sorteo en curso que conserva el servidor por rifa: el último
+    giro de la ruleta y los ganadores anunciados, para enviarlo a quien se une
+    tarde. Se borra al terminar el sorteo y cada entrada vence tras
+    `ttl_seconds` sin cambios. Cada proceso guarda lo que recibió de sus
+    propios clientes.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._states: Dict[int, Dict] = {}
+
+    def _entry(self, raffle_id: int) -> Dict:
+        self._prune()
+        entry = self._states.setdefault(raffle_id, {"spin": None, "winners": []})
+        entry["updated"] = time.monotonic()
+        return entry
+
+    def spin(self, raffle_id: int, data: Dict):
+        self._entry(raffle_id)["spin"] = data
+
+    def winner(self, raffle_id: int, data: Dict):
+        # El giro terminó: quien llegue ahora solo necesita los ganadores
+        entry = self._entry(raffle_id)
+        entry["spin"] = None
+        entry["winners"].append(data)
+
+    def snapshot(self, raffle_id: int) -> Optional[Dict]:
+        self._prune()
+        entry = self._states.get(raffle_id)
+        if entry is None:
+            return None
+        return {"raffle_id": raffle_id, "spin": entry["spin"], "winners": list(entry["winners"])}
+
+    def clear(self, raffle_id: int):
+        self._states.pop(raffle_id, None)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        for raffle_id in [raffle_id for raffle_id, entry in self._states.items() if entry["updated"] <= cutoff]:
+            del self._states[raffle_id]
+
+
+draw_state = DrawState(settings.DRAW_STATE_TTL_SECONDS)
+spin_relay = LatestEventRelay('wheel_spin', settings.WHEEL_SPIN_MIN_INTERVAL_SECONDS)
+
+
+def finish_draw(raffle_id: int):
+    """La rifa se completó o se eliminó: se descarta su estado de sorteo"""
+    draw_state.clear(raffle_id)
+    spin_relay.forget(raffle_id)
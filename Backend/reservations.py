@@ -0,0 +1,165 @@
+from sqlalchemy import select, update, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Raffle, Ticket, TicketStatus
+from occupancy import occupancy
+from cache import stats_cache, invalidate_raffle_catalogue
+from realtime import raffle_updates
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SweeperMetrics:
+    """Métricas del proceso que libera reservas vencidas"""
+
+    def __init__(self):
+        self.sweeps = 0
+        self.errors = 0
+        self.tickets_released = 0
+        self.last_released = 0
+        self.last_duration_seconds = 0.0
+        self.total_duration_seconds = 0.0
+        self.last_run_at = None
+
+    def record(self, released: int, duration: float):
+        self.sweeps += 1
+        self.tickets_released += released
+        self.last_released = released
+        self.last_duration_seconds = duration
+        self.total_duration_seconds += duration
+        self.last_run_at = datetime.utcnow()
+
+    def as_dict(self) -> Dict:
+        return {
+            "sweeps": self.sweeps,
+            "errors": self.errors,
+            "tickets_released": self.tickets_released,
+            "last_released": self.last_released,
+            "last_duration_seconds": round(self.last_duration_seconds, 4),
+            "avg_duration_seconds": round(self.total_duration_seconds / self.sweeps, 4) if self.sweeps else 0,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "interval_seconds": settings.RESERVATION_SWEEP_INTERVAL_SECONDS,
+            "batch_size": settings.RESERVATION_SWEEP_BATCH_SIZE
+        }
+
+
+sweeper_metrics = SweeperMetrics()
+
+
+async def expire_reservations(
+    db: AsyncSession, batch_size: int
+) -> Tuple[Dict[int, List[int]], Dict[int, Tuple[int, Optional[int]]]]:
+    """
+    Cancela las reservas vencidas por lotes. Cada lote es un UPDATE con
+    RETURNING y el ajuste de los contadores de las rifas afectadas, en la
+    misma transacción. Devuelve los números liberados agrupados por rifa y,
+    por rifa, (versión anterior al barrido, versión final); la final es None
+    si otro proceso cambió la rifa entre dos lotes.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=settings.RESERVATION_TTL_HOURS)
+    released: Dict[int, List[int]] = {}
+    versions: Dict[int, Tuple[int, Optional[int]]] = {}
+
+    while True:
+        # SKIP LOCKED evita pisarse con una confirmación de pago en curso
+        # o con el barrido de otro proceso
+        expired_ids = (
+            select(Ticket.id)
+            .where(Ticket.status == TicketStatus.RESERVED, Ticket.purchase_date < cutoff)
+            .order_by(Ticket.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        rows = (await db.execute(
+            update(Ticket)
+            .where(Ticket.id.in_(expired_ids), Ticket.status == TicketStatus.RESERVED)
+            .values(status=TicketStatus.CANCELLED)
+            .returning(Ticket.raffle_id, Ticket.ticket_number)
+            .execution_options(synchronize_session=False)
+        )).all()
+
+        if not rows:
+            await db.commit()
+            break
+
+        batch: Dict[int, List[int]] = {}
+        for raffle_id, ticket_number in rows:
+            batch.setdefault(raffle_id, []).append(ticket_number)
+
+        bumped = (await db.execute(
+            update(Raffle)
+            .where(Raffle.id.in_(batch.keys()))
+            .values(
+                tickets_reserved=Raffle.tickets_reserved - case(
+                    {raffle_id: len(numbers) for raffle_id, numbers in batch.items()},
+                    value=Raffle.id,
+                    else_=0
+                ),
+                version=Raffle.version + 1
+            )
+            .returning(Raffle.id, Raffle.version)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await db.commit()
+
+        for raffle_id, numbers in batch.items():
+            released.setdefault(raffle_id, []).extend(numbers)
+        for raffle_id, version in bumped:
+            if raffle_id not in versions:
+                versions[raffle_id] = (version - 1, version)
+            else:
+                previous, last = versions[raffle_id]
+                versions[raffle_id] = (previous, version if last is not None and version == last + 1 else None)
+
+        if len(rows) < batch_size:
+            break
+
+    return released, versions
+
+
+async def sweep_reservations() -> int:
+    """Ejecuta un barrido, actualiza los mapas de ocupación y avisa a los clientes"""
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        released, versions = await expire_reservations(db, settings.RESERVATION_SWEEP_BATCH_SIZE)
+    total = sum(len(numbers) for numbers in released.values())
+    sweeper_metrics.record(total, time.perf_counter() - start)
+    metrics.tickets_expired.inc(total)
+
+    if released:
+        stats_cache.invalidate("overview")
+        await invalidate_raffle_catalogue(*released.keys())
+    for raffle_id, numbers in released.items():
+        previous, version = versions.get(raffle_id, (None, None))
+        occupancy.release(raffle_id, numbers, version=version, previous=previous)
+        raffle_updates.record(raffle_id, reserved_delta=-len(numbers), numbers=numbers, state="free")
+
+    if total:
+        logger.info(f"Reservas vencidas liberadas: {total} boleto(s) en {len(released)} rifa(s)")
+    return total
+
+
+async def reservation_sweeper():
+    """Tarea en segundo plano iniciada desde el lifespan de la app"""
+    logger.info(
+        f"Barrido de reservas cada {settings.RESERVATION_SWEEP_INTERVAL_SECONDS}s "
+        f"(vencen a las {settings.RESERVATION_TTL_HOURS}h)"
+    )
+    while True:
+        try:
+            await sweep_reservations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            sweeper_metrics.errors += 1
+            logger.error(f"Error liberando reservas vencidas: {e}")
+        await asyncio.sleep(settings.RESERVATION_SWEEP_INTERVAL_SECONDS)
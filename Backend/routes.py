@@ -1,16 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import or_, and_, select, insert, update, func, case, cast, true, Integer
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-import random
+import secrets
+import base64
+import csv
+import enum
+import io
 import json
 import logging
+import zlib
 
-from models import User, Raffle, Ticket, Winner, Admin, TicketStatus
-from database import get_db
-from auth import create_access_token, get_current_admin, authenticate_admin
-from pydantic import BaseModel, validator
+from models import User, Raffle, Ticket, Winner, Admin, TicketStatus, ACTIVE_TICKET_STATUSES
+from database import get_db, dialect_insert, AsyncSessionLocal
+from auth import create_access_token, get_current_admin, authenticate_admin, invalidate_admin_cache, AdminPrincipal
+from occupancy import occupancy, STATE_NAMES
+from reservations import sweeper_metrics
+from cache import stats_cache, response_cache, raffle_key, raffle_list_key, invalidate_raffle_catalogue
+from realtime import emit, raffle_room, raffle_updates, finish_draw
+import metrics
+from passwords import password_pool, PasswordPoolBusy
+from pydantic import BaseModel, TypeAdapter, validator
 from config import settings  # IMPORTACIÓN AÑADIDA
 import asyncio
 
@@ -184,10 +199,45 @@ class DrawRequest(BaseModel):
             raise ValueError('La posición del premio debe ser 1, 2 o 3')
         return v
 
+class DrawBatchRequest(BaseModel):
+    raffle_id: int
+    prize_positions: List[int] = [1, 2, 3]
+    
+    @validator('prize_positions')
+    def validate_prize_positions(cls, v):
+        if not v:
+            raise ValueError('Debe indicar al menos una posición')
+        if len(set(v)) != len(v):
+            raise ValueError('Las posiciones no pueden repetirse')
+        if any(position not in [1, 2, 3] for position in v):
+            raise ValueError('La posición del premio debe ser 1, 2 o 3')
+        return sorted(v)
+
 class ConfirmPaymentRequest(BaseModel):
     ticket_ids: List[int]
     user_id: int
 
+# Ids por lista en una confirmación masiva
+MAX_BULK_CONFIRM_IDS = 5000
+
+class BulkConfirmPaymentRequest(BaseModel):
+    """
+    Las listas indicadas se combinan como filtros: se confirman las reservas que
+    cumplen todas (p. ej. ciertos usuarios dentro de ciertas rifas)
+    """
+    ticket_ids: List[int] = []
+    user_ids: List[int] = []
+    raffle_ids: List[int] = []
+    
+    @validator('raffle_ids', always=True)
+    def validate_selection(cls, v, values):
+        lists = (values.get('ticket_ids', []), values.get('user_ids', []), v)
+        if not any(lists):
+            raise ValueError('Debe indicar tickets, usuarios o rifas')
+        if any(len(ids) > MAX_BULK_CONFIRM_IDS for ids in lists):
+            raise ValueError(f'No puede enviar más de {MAX_BULK_CONFIRM_IDS} ids por lista')
+        return v
+
 class WinnerResponse(BaseModel):
     id: int
     user_id: int
@@ -213,8 +263,13 @@ class WhatsAppLinksResponse(BaseModel):
 
 # ========== RUTAS DE AUTENTICACIÓN ==========
 @router.post("/auth/login", response_model=Token)
-def login_admin(login_data: AdminLogin, db: Session = Depends(get_db)):
-    admin = authenticate_admin(db, login_data.username, login_data.password)
+async def login_admin(login_data: AdminLogin, db: AsyncSession = Depends(get_db)):
+    try:
+        admin = await authenticate_admin(db, login_data.username, login_data.password)
+    except HTTPException as e:
+        metrics.logins.inc(result="throttled" if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS else "error")
+        raise
+    metrics.logins.inc(result="success" if admin and admin.is_active else "failure")
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -244,82 +299,293 @@ def login_admin(login_data: AdminLogin, db: Session = Depends(get_db)):
         "email": admin.email
     }
 
+# ========== LISTADOS: CURSOR Y STREAMING ==========
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+def _wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def _keyset_page(db: AsyncSession, response: Response, query, id_column, limit: int):
+    """
+    Página ordenada por id. Si viene completa, X-Next-Cursor indica el
+    after_id de la siguiente; el listado entero se obtiene por NDJSON.
+    """
+    rows = (await db.scalars(query.order_by(id_column).limit(limit))).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+def _ndjson_response(query, id_column, schema) -> StreamingResponse:
+    """
+    Una fila JSON por línea, leída de un cursor del servidor por bloques, así
+    la memoria no crece con el tamaño del listado. Usa su propia sesión porque
+    el cuerpo se envía después de que termina la ruta.
+    """
+    async def rows():
+        async with AsyncSessionLocal() as db:
+            result = await db.stream_scalars(
+                query.order_by(id_column).execution_options(yield_per=STREAM_CHUNK_SIZE)
+            )
+            async for partition in result.partitions():
+                yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in partition)
+                db.expunge_all()
+
+    return StreamingResponse(rows(), media_type=NDJSON_MEDIA_TYPE)
+
+# Caracteres con los que Excel interpreta una celda como fórmula
+_CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, str) and value.startswith(_CSV_FORMULA_PREFIXES):
+        # Nombres cargados por el público: que no se ejecuten al abrir el archivo
+        return "'" + value
+    return value
+
+def _csv_response(request: Request, query, filename: str) -> StreamingResponse:
+    """
+    CSV leído de un cursor del servidor por bloques, como _ndjson_response: la
+    memoria no depende del número de filas. Se comprime con gzip al vuelo si el
+    cliente lo acepta.
+    """
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    
+    async def chunks():
+        # wbits=31: formato gzip (cabecera y CRC) en lugar de zlib
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            # BOM para que Excel abra el archivo como UTF-8
+            buffer.write("\ufeff")
+            writer.writerow(result.keys())
+            async for partition in result.partitions():
+                writer.writerows([_csv_value(value) for value in row] for row in partition)
+                chunk = buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+                yield compressor.compress(chunk) if compressor else chunk
+            # Sin filas la cabecera sigue en el buffer
+            if buffer.tell():
+                chunk = buffer.getvalue().encode("utf-8")
+                yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
+    
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks(), media_type="text/csv", headers=headers)
+
+# ========== VERSIONES Y ETAG ==========
+def _raffle_etag(resource: str, raffle_id: int, version: int) -> str:
+    return f'W/"{resource}-{raffle_id}-v{version}"'
+
+def _etag_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def _check_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Devuelve un 304 si el cliente ya tiene esta versión; si no, agrega el ETag
+    a la respuesta y devuelve None para que la ruta arme el cuerpo.
+    """
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+    response.headers.update(_etag_headers(etag))
+    return None
+
+def _json_with_etag(request: Request, etag: str, body: bytes) -> Response:
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+    return Response(content=body, media_type="application/json", headers=_etag_headers(etag))
+
+async def _bump_raffle_version(db: AsyncSession, raffle_id: int) -> Optional[int]:
+    """
+    Invalida los ETag de la rifa; se ejecuta en la misma transacción que el
+    cambio. Devuelve la nueva versión
+    """
+    return await db.scalar(
+        update(Raffle)
+        .where(Raffle.id == raffle_id)
+        .values(version=Raffle.version + 1)
+        .returning(Raffle.version)
+        .execution_options(synchronize_session=False)
+    )
+
 # ========== RUTAS PÚBLICAS ==========
 @router.post("/users/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.phone == user.phone).first()
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(User).where(User.phone == user.phone))
     if existing_user:
         return existing_user
     
     db_user = User(**user.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    stats_cache.invalidate("overview")
+    await db.refresh(db_user)
     return db_user
 
 @router.get("/users/", response_model=List[UserResponse])
-def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+async def get_users(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    # Obsoleto: OFFSET se degrada con la profundidad, usar after_id
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    if skip and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use after_id o skip, no ambos")
+    query = select(User)
+    if skip:
+        # Paginación por OFFSET: sin X-Next-Cursor para no mezclar los dos modos
+        query = query.order_by(User.id).offset(skip)
+        if _wants_ndjson(request):
+            return _ndjson_response(query, User.id, UserResponse)
+        return (await db.scalars(query.limit(limit))).all()
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    if _wants_ndjson(request):
+        return _ndjson_response(query, User.id, UserResponse)
+    return await _keyset_page(db, response, query, User.id, limit)
 
 @router.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return user
 
+_raffle_list_adapter = TypeAdapter(List[RaffleResponse])
+
 @router.get("/raffles/", response_model=List[RaffleResponse])
-def get_raffles(active_only: bool = True, db: Session = Depends(get_db)):
-    query = db.query(Raffle)
-    if active_only:
-        query = query.filter(Raffle.is_active == True, Raffle.is_completed == False)
-    raffles = query.order_by(Raffle.created_at.desc()).all()
-    return raffles
+async def get_raffles(request: Request, active_only: bool = True, db: AsyncSession = Depends(get_db)):
+    # El catálogo cambia pocas veces al día: se sirve ya serializado desde la caché
+    key = raffle_list_key(active_only)
+    cached = await response_cache.get(key)
+    if cached:
+        return _json_with_etag(request, *cached)
+    
+    generation = response_cache.generation
+    filters = [Raffle.is_active == True, Raffle.is_completed == False] if active_only else []
+    
+    # Cualquier cambio en el listado altera la cantidad, el id máximo o la suma de versiones
+    count, max_id, versions = (await db.execute(
+        select(func.count(Raffle.id), func.max(Raffle.id), func.sum(Raffle.version)).where(*filters)
+    )).one()
+    etag = f'W/"raffles-{int(active_only)}-{count}-{max_id}-{versions}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+    
+    raffles = (await db.scalars(select(Raffle).where(*filters).order_by(Raffle.created_at.desc()))).all()
+    body = _raffle_list_adapter.dump_json(_raffle_list_adapter.validate_python(raffles, from_attributes=True))
+    await response_cache.set(key, etag, body, generation)
+    return _json_with_etag(request, etag, body)
 
 @router.get("/raffles/{raffle_id}", response_model=RaffleResponse)
-def get_raffle(raffle_id: int, db: Session = Depends(get_db)):
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+async def get_raffle(raffle_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    key = raffle_key(raffle_id)
+    cached = await response_cache.get(key)
+    if cached:
+        return _json_with_etag(request, *cached)
+    
+    generation = response_cache.generation
+    raffle = await db.get(Raffle, raffle_id)
+    if not raffle:
+        raise HTTPException(status_code=404, detail="Rifa no encontrada")
+    
+    etag = _raffle_etag("raffle", raffle_id, raffle.version)
+    body = RaffleResponse.model_validate(raffle).model_dump_json().encode()
+    await response_cache.set(key, etag, body, generation)
+    return _json_with_etag(request, etag, body)
+
+@router.get("/raffles/{raffle_id}/ticket-map")
+async def get_ticket_map(raffle_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Estado de cada número para el selector: 2 bits por número (0 libre,
+    1 reservado, 2 pagado), el número n en el byte (n-1) // 4. Se sirve desde
+    el mapa en memoria, en base64 o en binario con Accept: application/octet-stream.
+    """
+    raffle = await db.get(Raffle, raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
-    return raffle
+    
+    not_modified = _check_etag(request, response, _raffle_etag("ticket-map", raffle_id, raffle.version))
+    if not_modified:
+        return not_modified
+    
+    packed = (await occupancy.get(db, raffle)).packed()
+    if "application/octet-stream" in request.headers.get("accept", ""):
+        return Response(
+            content=packed,
+            media_type="application/octet-stream",
+            headers={"X-Total-Tickets": str(raffle.total_tickets), **response.headers}
+        )
+    return {
+        "raffle_id": raffle.id,
+        "total_tickets": raffle.total_tickets,
+        "encoding": "2bit",
+        "states": STATE_NAMES,
+        "data": base64.b64encode(packed).decode("ascii")
+    }
 
 # ========== RUTAS PROTEGIDAS ==========
 @router.post("/raffles/", response_model=RaffleResponse, status_code=status.HTTP_201_CREATED)
-def create_raffle(
+async def create_raffle(
     raffle: RaffleCreate, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     db_raffle = Raffle(**raffle.dict())
     db.add(db_raffle)
-    db.commit()
-    db.refresh(db_raffle)
+    await db.commit()
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue()
+    await db.refresh(db_raffle)
     return db_raffle
 
 @router.put("/raffles/{raffle_id}/complete")
-def complete_raffle(
+async def complete_raffle(
     raffle_id: int, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+    raffle = await db.get(Raffle, raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
     raffle.is_completed = True
     raffle.is_active = False
     raffle.draw_date = datetime.utcnow()
-    db.commit()
+    await _bump_raffle_version(db, raffle_id)
+    await db.commit()
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(raffle_id)
+    occupancy.discard(raffle_id)
+    finish_draw(raffle_id)
     return {"message": "Rifa marcada como completada"}
 
 @router.delete("/raffles/{raffle_id}")
-def delete_raffle(
+async def delete_raffle(
     raffle_id: int,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+    raffle = await db.get(Raffle, raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
@@ -329,20 +595,40 @@ def delete_raffle(
             detail="No se puede eliminar una rifa activa"
         )
     
-    ticket_count = db.query(Ticket).filter(Ticket.raffle_id == raffle_id).count()
+    ticket_count = await db.scalar(select(func.count(Ticket.id)).where(Ticket.raffle_id == raffle_id))
     if ticket_count > 0:
         raise HTTPException(
             status_code=400,
             detail="No se puede eliminar una rifa con tickets vendidos"
         )
     
-    db.delete(raffle)
-    db.commit()
+    await db.delete(raffle)
+    await db.commit()
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(raffle_id)
+    occupancy.discard(raffle_id)
+    finish_draw(raffle_id)
     return {"message": "Rifa eliminada exitosamente"}
 
+async def _taken_numbers(db: AsyncSession, raffle_id: int, numbers: List[int]) -> List[int]:
+    """Consulta indexada de cuáles de los números dados están reservados o pagados"""
+    taken = await db.scalars(
+        select(Ticket.ticket_number).where(
+            Ticket.raffle_id == raffle_id,
+            Ticket.ticket_number.in_(numbers),
+            Ticket.status.in_(ACTIVE_TICKET_STATUSES)
+        )
+    )
+    return sorted(taken)
+
+def _unavailable_detail(numbers: List[int]) -> str:
+    if len(numbers) == 1:
+        return f"El número {numbers[0]} ya está reservado o vendido"
+    return f"Los números {', '.join(map(str, numbers))} ya están reservados o vendidos"
+
 @router.post("/tickets/purchase", response_model=TicketPurchaseWithWhatsApp)
-def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
-    raffle = db.query(Raffle).filter(Raffle.id == purchase.raffle_id).first()
+async def purchase_tickets(purchase: TicketPurchase, db: AsyncSession = Depends(get_db)):
+    raffle = await db.get(Raffle, purchase.raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
@@ -352,7 +638,7 @@ def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
     if raffle.is_completed:
         raise HTTPException(status_code=400, detail="La rifa ya ha sido completada")
     
-    user = db.query(User).filter(User.id == purchase.user_id).first()
+    user = await db.get(User, purchase.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
@@ -366,15 +652,8 @@ def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
             detail=f"Solo hay {available_tickets} boletos disponibles"
         )
     
-    # Obtener números ya ocupados (usando subquery para mejor rendimiento)
-    from sqlalchemy import func
-    occupied_numbers_subquery = db.query(Ticket.ticket_number).filter(
-        Ticket.raffle_id == raffle.id,
-        Ticket.status.in_([TicketStatus.PAID, TicketStatus.RESERVED])
-    ).subquery()
-    
-    occupied_numbers = db.query(occupied_numbers_subquery.c.ticket_number).all()
-    occupied_numbers = [num[0] for num in occupied_numbers]
+    if len(set(purchase.ticket_numbers)) != len(purchase.ticket_numbers):
+        raise HTTPException(status_code=400, detail="Hay números repetidos en la selección")
     
     for ticket_number in purchase.ticket_numbers:
         if ticket_number < 1 or ticket_number > raffle.total_tickets:
@@ -382,37 +661,98 @@ def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
                 status_code=400,
                 detail=f"El número {ticket_number} está fuera del rango (1-{raffle.total_tickets})"
             )
-        if ticket_number in occupied_numbers:
+    
+    # Verificación rápida contra el mapa de ocupación en memoria. El mapa puede
+    # estar desactualizado (otro proceso liberó números), así que solo se
+    # rechaza lo que la base de datos confirma como ocupado
+    occupied_map = await occupancy.get(db, raffle)
+    suspected = occupied_map.occupied_among(purchase.ticket_numbers)
+    if suspected:
+        taken = await _taken_numbers(db, raffle.id, suspected)
+        occupancy.release(raffle.id, set(suspected) - set(taken))
+        if taken:
             raise HTTPException(
                 status_code=400,
-                detail=f"El número {ticket_number} ya está reservado o vendido"
+                detail=_unavailable_detail(taken),
+                headers={"X-Unavailable-Numbers": ",".join(map(str, taken))}
             )
     
-    tickets = []
-    for ticket_number in purchase.ticket_numbers:
-        ticket = Ticket(
-            ticket_number=ticket_number,
-            user_id=purchase.user_id,
-            raffle_id=purchase.raffle_id,
-            status=TicketStatus.RESERVED,
-            payment_confirmed=False
+    # Inserción masiva; el índice único parcial descarta los números que otra
+    # compra concurrente ya reservó y RETURNING indica cuáles sí se insertaron
+    purchase_date = datetime.utcnow()
+    insert = dialect_insert(db.bind)
+    insert_stmt = insert(Ticket).values([
+        {
+            "ticket_number": ticket_number,
+            "user_id": purchase.user_id,
+            "raffle_id": purchase.raffle_id,
+            "purchase_date": purchase_date,
+            "status": TicketStatus.RESERVED,
+            "payment_confirmed": False,
+            "is_winner": False
+        }
+        for ticket_number in purchase.ticket_numbers
+    ]).on_conflict_do_nothing(
+        index_elements=[Ticket.raffle_id, Ticket.ticket_number],
+        index_where=Ticket.status.in_(ACTIVE_TICKET_STATUSES)
+    ).returning(Ticket.id, Ticket.ticket_number)
+    inserted = (await db.execute(insert_stmt)).all()
+    
+    lost = sorted(set(purchase.ticket_numbers) - {row.ticket_number for row in inserted})
+    if lost:
+        await db.rollback()
+        occupancy.reserve(purchase.raffle_id, lost)
+        raise HTTPException(
+            status_code=409,
+            detail=_unavailable_detail(lost),
+            headers={"X-Unavailable-Numbers": ",".join(map(str, lost))}
         )
-        db.add(ticket)
-        tickets.append(ticket)
-    
-    # Actualizar contador de reservas
-    raffle.tickets_reserved += len(purchase.ticket_numbers)
     
-    db.commit()
-    
-    for ticket in tickets:
-        db.refresh(ticket)
+    # Actualizar contador de reservas de forma atómica y sin exceder el total
+    reserved = len(inserted)
+    counter_result = await db.execute(
+        update(Raffle)
+        .where(
+            Raffle.id == raffle.id,
+            Raffle.tickets_sold + Raffle.tickets_reserved + reserved <= Raffle.total_tickets
+        )
+        .values(tickets_reserved=Raffle.tickets_reserved + reserved, version=Raffle.version + 1)
+        .returning(Raffle.version)
+        .execution_options(synchronize_session=False)
+    )
+    new_version = counter_result.scalar()
+    if new_version is None:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="No quedan suficientes boletos disponibles")
+    
+    await db.commit()
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(raffle.id)
+    occupancy.reserve(raffle.id, purchase.ticket_numbers, version=new_version)
+    raffle_updates.record(raffle.id, reserved_delta=reserved, numbers=purchase.ticket_numbers, state="reserved")
+    metrics.tickets_reserved.inc(reserved)
+    
+    tickets = [
+        {
+            "id": row.id,
+            "ticket_number": row.ticket_number,
+            "user_id": purchase.user_id,
+            "raffle_id": purchase.raffle_id,
+            "purchase_date": purchase_date,
+            "status": TicketStatus.RESERVED.value,
+            "payment_confirmed": False,
+            "is_winner": False
+        }
+        for row in sorted(inserted, key=lambda row: row.id)
+    ]
     
     # Generar enlaces de WhatsApp para los administradores con teléfono
-    admins_with_phone = db.query(Admin).filter(
-        Admin.phone.isnot(None),
-        Admin.is_active == True
-    ).all()
+    admins_with_phone = (await db.scalars(
+        select(Admin).where(
+            Admin.phone.isnot(None),
+            Admin.is_active == True
+        )
+    )).all()
     
     whatsapp_links = []
     for admin in admins_with_phone:
@@ -443,8 +783,8 @@ def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
             "link": whatsapp_link
         })
     
-    # La reserva es válida por 24 horas
-    reserved_until = datetime.utcnow() + timedelta(hours=24)
+    # La reserva vence pasado el plazo configurado (ver reservations.py)
+    reserved_until = purchase_date + timedelta(hours=settings.RESERVATION_TTL_HOURS)
     
     return {
         "tickets": tickets,
@@ -453,109 +793,275 @@ def purchase_tickets(purchase: TicketPurchase, db: Session = Depends(get_db)):
     }
 
 @router.get("/tickets/user/{user_id}", response_model=List[TicketResponse])
-def get_user_tickets(user_id: int, db: Session = Depends(get_db)):
-    tickets = db.query(Ticket).filter(Ticket.user_id == user_id).all()
-    return tickets
+async def get_user_tickets(
+    user_id: int,
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(Ticket).where(Ticket.user_id == user_id)
+    if after_id is not None:
+        query = query.where(Ticket.id > after_id)
+    if _wants_ndjson(request):
+        return _ndjson_response(query, Ticket.id, TicketResponse)
+    return await _keyset_page(db, response, query, Ticket.id, limit)
 
 @router.get("/tickets/raffle/{raffle_id}", response_model=List[TicketResponse])
-def get_raffle_tickets(raffle_id: int, db: Session = Depends(get_db)):
-    tickets = db.query(Ticket).filter(Ticket.raffle_id == raffle_id).all()
-    return tickets
+async def get_raffle_tickets(
+    raffle_id: int,
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(Ticket).where(Ticket.raffle_id == raffle_id)
+    if after_id is not None:
+        query = query.where(Ticket.id > after_id)
+    if _wants_ndjson(request):
+        return _ndjson_response(query, Ticket.id, TicketResponse)
+    return await _keyset_page(db, response, query, Ticket.id, limit)
+
+def _days_since(column, dialect_name: str):
+    """Días completos transcurridos desde `column` (UTC), calculados en la base de datos"""
+    if dialect_name == "sqlite":
+        return cast(func.julianday("now") - func.julianday(column), Integer)
+    return cast(func.date_part("day", func.timezone("utc", func.now()) - column), Integer)
+
+def _pending_tickets_query(dialect_name: str):
+    """Tickets reservados pendientes de pago con su usuario y rifa en una sola consulta"""
+    return (
+        select(
+            Ticket.id,
+            Ticket.ticket_number,
+            User.name.label("user_name"),
+            User.phone.label("user_phone"),
+            User.email.label("user_email"),
+            User.id.label("user_id"),
+            Raffle.title.label("raffle_title"),
+            Raffle.id.label("raffle_id"),
+            Raffle.ticket_price,
+            Ticket.purchase_date.label("reserved_date"),
+            _days_since(Ticket.purchase_date, dialect_name).label("days_ago")
+        )
+        .join(User, User.id == Ticket.user_id)
+        .join(Raffle, Raffle.id == Ticket.raffle_id)
+        .where(
+            Ticket.status == TicketStatus.RESERVED,
+            Ticket.payment_confirmed == False
+        )
+    )
 
 @router.get("/tickets/pending")
-def get_pending_tickets(
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+async def get_pending_tickets(
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    # Obtener tickets reservados pendientes de pago
-    pending_tickets = db.query(Ticket).filter(
-        Ticket.status == TicketStatus.RESERVED,
-        Ticket.payment_confirmed == False
-    ).all()
-    
-    result = []
-    for ticket in pending_tickets:
-        user = db.query(User).filter(User.id == ticket.user_id).first()
-        raffle = db.query(Raffle).filter(Raffle.id == ticket.raffle_id).first()
-        
-        result.append({
-            "id": ticket.id,
-            "ticket_number": ticket.ticket_number,
-            "user_name": user.name,
-            "user_phone": user.phone,
-            "user_email": user.email,
-            "user_id": user.id,
-            "raffle_title": raffle.title,
-            "raffle_id": raffle.id,
-            "ticket_price": raffle.ticket_price,
-            "reserved_date": ticket.purchase_date,
-            "days_ago": (datetime.utcnow() - ticket.purchase_date).days
-        })
-    
-    return result
+    rows = (await db.execute(_pending_tickets_query(db.bind.dialect.name))).mappings().all()
+    return [dict(row) for row in rows]
+
+async def _confirm_reserved_tickets(db: AsyncSession, condition):
+    """
+    Pasa a PAID las reservas que cumplen `condition` con un UPDATE ... RETURNING
+    y ajusta los contadores de todas las rifas afectadas en un UPDATE agrupado,
+    dentro de la transacción de `db` (no hace commit). Devuelve los números
+    confirmados por rifa y (título, precio, versión nueva) de cada rifa.
+    """
+    rows = (await db.execute(
+        update(Ticket)
+        .where(condition, Ticket.status == TicketStatus.RESERVED)
+        .values(status=TicketStatus.PAID, payment_confirmed=True, payment_date=datetime.utcnow())
+        .returning(Ticket.raffle_id, Ticket.ticket_number)
+        .execution_options(synchronize_session=False)
+    )).all()
+    
+    confirmed: Dict[int, List[int]] = {}
+    for raffle_id, ticket_number in rows:
+        confirmed.setdefault(raffle_id, []).append(ticket_number)
+    if not confirmed:
+        return confirmed, {}
+    
+    counts = {raffle_id: len(numbers) for raffle_id, numbers in confirmed.items()}
+    raffles = (await db.execute(
+        update(Raffle)
+        .where(Raffle.id.in_(counts.keys()))
+        .values(
+            tickets_sold=Raffle.tickets_sold + case(counts, value=Raffle.id, else_=0),
+            tickets_reserved=Raffle.tickets_reserved - case(counts, value=Raffle.id, else_=0),
+            version=Raffle.version + 1
+        )
+        .returning(Raffle.id, Raffle.title, Raffle.ticket_price, Raffle.version)
+        .execution_options(synchronize_session=False)
+    )).all()
+    return confirmed, {raffle_id: (title, price, version) for raffle_id, title, price, version in raffles}
+
+async def _after_payments_confirmed(confirmed: Dict[int, List[int]], raffles: Dict[int, tuple]):
+    """Cachés, mapas de ocupación y eventos tras el commit de una confirmación"""
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(*confirmed.keys())
+    for raffle_id, numbers in confirmed.items():
+        occupancy.mark_paid(raffle_id, numbers, version=raffles[raffle_id][2])
+        raffle_updates.record(
+            raffle_id,
+            sold_delta=len(numbers),
+            reserved_delta=-len(numbers),
+            numbers=numbers,
+            state="paid"
+        )
+    metrics.tickets_paid.inc(sum(len(numbers) for numbers in confirmed.values()))
 
 @router.post("/tickets/confirm-payment")
-def confirm_payment(
+async def confirm_payment(
     confirm_request: ConfirmPaymentRequest,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    tickets = db.query(Ticket).filter(
+    confirmed, raffles = await _confirm_reserved_tickets(db, and_(
         Ticket.id.in_(confirm_request.ticket_ids),
-        Ticket.user_id == confirm_request.user_id,
-        Ticket.status == TicketStatus.RESERVED
-    ).all()
+        Ticket.user_id == confirm_request.user_id
+    ))
     
-    if not tickets:
+    if not confirmed:
         raise HTTPException(status_code=404, detail="No se encontraron tickets reservados")
     
     # Verificar que todos los tickets sean de la misma rifa
-    raffle_ids = set(ticket.raffle_id for ticket in tickets)
-    if len(raffle_ids) != 1:
+    if len(confirmed) != 1:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Los tickets deben ser de la misma rifa")
     
-    raffle_id = list(raffle_ids)[0]
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+    await db.commit()
+    await _after_payments_confirmed(confirmed, raffles)
     
-    # Actualizar cada ticket
-    for ticket in tickets:
-        ticket.status = TicketStatus.PAID
-        ticket.payment_confirmed = True
-        ticket.payment_date = datetime.utcnow()
-    
-    # Actualizar contadores de la rifa
-    raffle.tickets_sold += len(tickets)
-    raffle.tickets_reserved -= len(tickets)
-    
-    db.commit()
+    raffle_id, numbers = next(iter(confirmed.items()))
+    return {
+        "message": f"Pago confirmado para {len(numbers)} ticket(s)",
+        "confirmed_tickets": len(numbers),
+        "total_amount": len(numbers) * raffles[raffle_id][1]
+    }
+
+@router.post("/tickets/confirm-payment/bulk")
+async def confirm_payments_bulk(
+    confirm_request: BulkConfirmPaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Confirma de una vez las reservas de varios tickets, usuarios o rifas (la intersección de los filtros)"""
+    selection = []
+    if confirm_request.ticket_ids:
+        selection.append(Ticket.id.in_(confirm_request.ticket_ids))
+    if confirm_request.user_ids:
+        selection.append(Ticket.user_id.in_(confirm_request.user_ids))
+    if confirm_request.raffle_ids:
+        selection.append(Ticket.raffle_id.in_(confirm_request.raffle_ids))
+    
+    confirmed, raffles = await _confirm_reserved_tickets(db, and_(*selection))
+    if not confirmed:
+        raise HTTPException(status_code=404, detail="No se encontraron tickets reservados")
     
+    await db.commit()
+    await _after_payments_confirmed(confirmed, raffles)
+    
+    totals = [
+        {
+            "raffle_id": raffle_id,
+            "raffle_title": raffles[raffle_id][0],
+            "confirmed_tickets": len(numbers),
+            "ticket_numbers": sorted(numbers),
+            "total_amount": len(numbers) * raffles[raffle_id][1]
+        }
+        for raffle_id, numbers in sorted(confirmed.items())
+    ]
+    confirmed_tickets = sum(total["confirmed_tickets"] for total in totals)
+    logger.info(f"Pago confirmado en bloque: {confirmed_tickets} ticket(s) en {len(totals)} rifa(s) por {current_admin.username}")
     return {
-        "message": f"Pago confirmado para {len(tickets)} ticket(s)",
-        "confirmed_tickets": len(tickets),
-        "total_amount": len(tickets) * raffle.ticket_price
+        "message": f"Pago confirmado para {confirmed_tickets} ticket(s) en {len(totals)} rifa(s)",
+        "confirmed_tickets": confirmed_tickets,
+        "total_amount": sum(total["total_amount"] for total in totals),
+        "raffles": totals
     }
 
+def _eligible_tickets_filter(raffle_id: int, excluded_user_ids):
+    """Solo tickets pagados, que no hayan ganado y de usuarios sin premio en la rifa"""
+    conditions = [
+        Ticket.raffle_id == raffle_id,
+        Ticket.status == TicketStatus.PAID,
+        Ticket.is_winner == False
+    ]
+    if excluded_user_ids:
+        conditions.append(~Ticket.user_id.in_(excluded_user_ids))
+    return and_(*conditions)
+
+async def _pick_random_ticket(db: AsyncSession, raffle_id: int, excluded_user_ids, attempts: int = 3) -> Optional[Ticket]:
+    """
+    Elige un ticket elegible al azar trayendo una sola fila: cuenta los
+    candidatos, sortea un desplazamiento con `secrets` y lee el id sin
+    bloquear. Después bloquea solo esa fila (en PostgreSQL un OFFSET con FOR
+    UPDATE bloquearía también todas las filas saltadas). SKIP LOCKED descarta
+    el ticket si otro sorteo en curso ya lo tomó, y entonces se vuelve a sortear.
+    """
+    eligible = _eligible_tickets_filter(raffle_id, excluded_user_ids)
+    for _ in range(attempts):
+        total = await db.scalar(select(func.count(Ticket.id)).where(eligible))
+        if not total:
+            return None
+        ticket_id = await db.scalar(
+            select(Ticket.id)
+            .where(eligible)
+            .order_by(Ticket.id)
+            .offset(secrets.randbelow(total))
+            .limit(1)
+        )
+        if ticket_id is None:
+            # Los candidatos cambiaron entre el conteo y la lectura
+            continue
+        ticket = await db.scalar(
+            select(Ticket)
+            .where(Ticket.id == ticket_id, eligible)
+            .with_for_update(skip_locked=True)
+        )
+        if ticket is not None:
+            return ticket
+    return None
+
+def _prize_description(raffle: Raffle, prize_position: int) -> str:
+    """Asignar el premio correspondiente según la posición"""
+    if prize_position == 1:
+        return f"1° Lugar - {raffle.prize_first}"
+    elif prize_position == 2:
+        return f"2° Lugar - {raffle.prize_second}"
+    elif prize_position == 3:
+        return f"3° Lugar - {raffle.prize_third}"
+    return f"Premio {prize_position}° Lugar"
+
+def _winner_whatsapp_link(user: User, raffle: Raffle, prize_position: int, ticket_number: int, prize_description: str) -> str:
+    return f"https://wa.me/{user.phone}?text=Felicidades {user.name}! Has ganado el {prize_position}° premio en la rifa '{raffle.title}' con el boleto numero {ticket_number}. Premio: {prize_description}"
+
 # ========== RUTAS DE SORTEO ==========
 @router.post("/draw", response_model=WinnerResponse)
-def perform_draw(
+async def perform_draw(
     draw_request: DrawRequest, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    raffle = db.query(Raffle).filter(Raffle.id == draw_request.raffle_id).first()
+    raffle = await db.get(Raffle, draw_request.raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
-    existing_winners = db.query(Winner).filter(Winner.raffle_id == raffle.id).all()
-    existing_winner_user_ids = [winner.user_id for winner in existing_winners]
+    existing_winner_user_ids = (await db.scalars(
+        select(Winner.user_id).where(Winner.raffle_id == raffle.id)
+    )).all()
     
     if draw_request.winning_ticket_id:
-        winning_ticket = db.query(Ticket).filter(
-            Ticket.id == draw_request.winning_ticket_id,
-            Ticket.raffle_id == raffle.id,
-            Ticket.status == TicketStatus.PAID,
-            Ticket.is_winner == False
-        ).first()
+        winning_ticket = await db.scalar(
+            select(Ticket).where(
+                Ticket.id == draw_request.winning_ticket_id,
+                Ticket.raffle_id == raffle.id,
+                Ticket.status == TicketStatus.PAID,
+                Ticket.is_winner == False
+            ).with_for_update()
+        )
         
         if not winning_ticket:
             raise HTTPException(
@@ -569,28 +1075,22 @@ def perform_draw(
                 detail="Este usuario ya ha ganado en esta rifa"
             )
     else:
-        # Solo tickets pagados pueden ganar
-        available_tickets = db.query(Ticket).filter(
-            Ticket.raffle_id == raffle.id,
-            Ticket.status == TicketStatus.PAID,
-            Ticket.is_winner == False,
-            ~Ticket.user_id.in_(existing_winner_user_ids) if existing_winner_user_ids else True
-        ).all()
+        winning_ticket = await _pick_random_ticket(db, raffle.id, existing_winner_user_ids)
         
-        if not available_tickets:
+        if not winning_ticket:
             raise HTTPException(
                 status_code=400,
                 detail="No hay boletos pagados disponibles para sortear"
             )
-        
-        winning_ticket = random.choice(available_tickets)
     
-    user = db.query(User).filter(User.id == winning_ticket.user_id).first()
+    user = await db.get(User, winning_ticket.user_id)
     
-    existing_winner = db.query(Winner).filter(
-        Winner.raffle_id == raffle.id,
-        Winner.prize_position == draw_request.prize_position
-    ).first()
+    existing_winner = await db.scalar(
+        select(Winner).where(
+            Winner.raffle_id == raffle.id,
+            Winner.prize_position == draw_request.prize_position
+        )
+    )
     
     if existing_winner:
         raise HTTPException(
@@ -598,15 +1098,7 @@ def perform_draw(
             detail=f"Ya existe un ganador para la posición {draw_request.prize_position}"
         )
     
-    # Asignar el premio correspondiente según la posición
-    if draw_request.prize_position == 1:
-        prize_description = f"1° Lugar - {raffle.prize_first}"
-    elif draw_request.prize_position == 2:
-        prize_description = f"2° Lugar - {raffle.prize_second}"
-    elif draw_request.prize_position == 3:
-        prize_description = f"3° Lugar - {raffle.prize_third}"
-    else:
-        prize_description = f"Premio {draw_request.prize_position}° Lugar"
+    prize_description = _prize_description(raffle, draw_request.prize_position)
     
     winner = Winner(
         user_id=winning_ticket.user_id,
@@ -615,20 +1107,38 @@ def perform_draw(
         prize_position=draw_request.prize_position,
         prize_description=prize_description,
         notified=False,
-        whatsapp_link=f"https://wa.me/{user.phone}?text=Felicidades {user.name}! Has ganado el {draw_request.prize_position}° premio en la rifa '{raffle.title}' con el boleto numero {winning_ticket.ticket_number}. Premio: {prize_description}"
+        whatsapp_link=_winner_whatsapp_link(user, raffle, draw_request.prize_position, winning_ticket.ticket_number, prize_description)
     )
     
     winning_ticket.is_winner = True
     
-    total_winners = db.query(Winner).filter(Winner.raffle_id == raffle.id).count()
+    total_winners = await db.scalar(select(func.count(Winner.id)).where(Winner.raffle_id == raffle.id))
     if total_winners + 1 >= 3:
         raffle.is_completed = True
         raffle.is_active = False
         raffle.draw_date = datetime.utcnow()
     
     db.add(winner)
-    db.commit()
-    db.refresh(winner)
+    new_version = await _bump_raffle_version(db, raffle.id)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Otro sorteo simultáneo asignó la misma posición (índice único)
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ya existe un ganador para la posición {draw_request.prize_position}"
+        )
+    metrics.draws.inc(mode="single")
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(raffle.id)
+    await db.refresh(winner)
+    
+    if raffle.is_completed:
+        occupancy.discard(raffle.id)
+        finish_draw(raffle.id)
+    else:
+        occupancy.advance(raffle.id, new_version)
     
     winner_details = {
         "id": winner.id,
@@ -648,16 +1158,121 @@ def perform_draw(
     
     return winner_details
 
-@router.get("/winners/raffle/{raffle_id}", response_model=List[WinnerResponse])
-def get_raffle_winners(raffle_id: int, db: Session = Depends(get_db)):
-    winners = db.query(Winner).filter(Winner.raffle_id == raffle_id).all()
+@router.post("/draw/batch", response_model=List[WinnerResponse])
+async def perform_batch_draw(
+    draw_request: DrawBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """
+    Sortea todas las posiciones pedidas en una sola transacción: un único
+    recorrido de los tickets elegibles, inserción de los ganadores en bloque y
+    un solo commit. O se asignan todos los premios o ninguno.
+    """
+    # Bloquear la rifa serializa los sorteos simultáneos sobre ella
+    raffle = await db.scalar(select(Raffle).where(Raffle.id == draw_request.raffle_id).with_for_update())
+    if not raffle:
+        raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
-    result = []
-    for winner in winners:
-        user = db.query(User).filter(User.id == winner.user_id).first()
-        ticket = db.query(Ticket).filter(Ticket.id == winner.ticket_id).first()
-        
-        result.append({
+    existing_winners = (await db.execute(
+        select(Winner.user_id, Winner.prize_position).where(Winner.raffle_id == raffle.id)
+    )).all()
+    taken_positions = sorted({position for _, position in existing_winners} & set(draw_request.prize_positions))
+    if taken_positions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ya existe un ganador para la(s) posición(es) {', '.join(map(str, taken_positions))}"
+        )
+    
+    # Un solo recorrido del conjunto elegible, trayendo solo id y usuario
+    candidates = (await db.execute(
+        select(Ticket.id, Ticket.user_id)
+        .where(_eligible_tickets_filter(raffle.id, [user_id for user_id, _ in existing_winners]))
+    )).all()
+    
+    # Cada usuario puede ganar una sola vez por rifa
+    chosen = []
+    winner_user_ids = set()
+    rng = secrets.SystemRandom()
+    while candidates and len(chosen) < len(draw_request.prize_positions):
+        index = rng.randrange(len(candidates))
+        ticket_id, user_id = candidates[index]
+        candidates[index] = candidates[-1]
+        candidates.pop()
+        if user_id not in winner_user_ids:
+            winner_user_ids.add(user_id)
+            chosen.append(ticket_id)
+    
+    if len(chosen) < len(draw_request.prize_positions):
+        raise HTTPException(
+            status_code=400,
+            detail="No hay suficientes boletos pagados de distintos usuarios para sortear todas las posiciones"
+        )
+    
+    tickets = {
+        ticket.id: ticket for ticket in (await db.scalars(
+            select(Ticket)
+            .options(joinedload(Ticket.user))
+            .where(Ticket.id.in_(chosen), Ticket.is_winner == False)
+            .with_for_update(of=Ticket)
+        )).all()
+    }
+    if len(tickets) != len(chosen):
+        raise HTTPException(
+            status_code=409,
+            detail="Otro sorteo tomó alguno de los boletos elegidos, intente nuevamente"
+        )
+    
+    winner_rows = []
+    for ticket_id, prize_position in zip(chosen, draw_request.prize_positions):
+        ticket = tickets[ticket_id]
+        prize_description = _prize_description(raffle, prize_position)
+        winner_rows.append({
+            "user_id": ticket.user_id,
+            "raffle_id": raffle.id,
+            "ticket_id": ticket.id,
+            "prize_position": prize_position,
+            "prize_description": prize_description,
+            "notified": False,
+            "whatsapp_link": _winner_whatsapp_link(ticket.user, raffle, prize_position, ticket.ticket_number, prize_description),
+            "created_at": datetime.utcnow()
+        })
+    
+    try:
+        winners = (await db.scalars(insert(Winner).returning(Winner), winner_rows)).all()
+    except IntegrityError:
+        # Un /draw individual asignó alguna de las posiciones (índice único)
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Otro sorteo asignó alguna de las posiciones, intente nuevamente"
+        )
+    
+    await db.execute(
+        update(Ticket)
+        .where(Ticket.id.in_(chosen))
+        .values(is_winner=True)
+        .execution_options(synchronize_session=False)
+    )
+    
+    if len(existing_winners) + len(winners) >= 3:
+        raffle.is_completed = True
+        raffle.is_active = False
+        raffle.draw_date = datetime.utcnow()
+    
+    new_version = await _bump_raffle_version(db, raffle.id)
+    await db.commit()
+    metrics.draws.inc(len(winners), mode="batch")
+    stats_cache.invalidate("overview")
+    await invalidate_raffle_catalogue(raffle.id)
+    if raffle.is_completed:
+        occupancy.discard(raffle.id)
+        finish_draw(raffle.id)
+    else:
+        occupancy.advance(raffle.id, new_version)
+    
+    winner_details = [
+        {
             "id": winner.id,
             "user_id": winner.user_id,
             "raffle_id": winner.raffle_id,
@@ -668,40 +1283,85 @@ def get_raffle_winners(raffle_id: int, db: Session = Depends(get_db)):
             "notification_date": winner.notification_date,
             "whatsapp_link": winner.whatsapp_link,
             "created_at": winner.created_at,
-            "user_name": user.name,
-            "user_phone": user.phone,
-            "ticket_number": ticket.ticket_number
-        })
+            "user_name": tickets[winner.ticket_id].user.name,
+            "user_phone": tickets[winner.ticket_id].user.phone,
+            "ticket_number": tickets[winner.ticket_id].ticket_number
+        }
+        for winner in sorted(winners, key=lambda winner: winner.prize_position)
+    ]
+    
+    await emit('winners_drawn', {
+        "raffle_id": raffle.id,
+        "is_completed": raffle.is_completed,
+        "winners": jsonable_encoder(winner_details)
+    }, room=raffle_room(raffle.id))
     
-    return result
+    return winner_details
+
+def _winner_details_query():
+    """Ganadores con nombre, teléfono y número de ticket en una sola consulta"""
+    return (
+        select(
+            Winner.id,
+            Winner.user_id,
+            Winner.raffle_id,
+            Winner.ticket_id,
+            Winner.prize_position,
+            Winner.prize_description,
+            Winner.notified,
+            Winner.notification_date,
+            Winner.whatsapp_link,
+            Winner.created_at,
+            User.name.label("user_name"),
+            User.phone.label("user_phone"),
+            Ticket.ticket_number
+        )
+        .join(User, User.id == Winner.user_id)
+        .join(Ticket, Ticket.id == Winner.ticket_id)
+        .order_by(Winner.prize_position)
+    )
+
+@router.get("/winners/raffle/{raffle_id}", response_model=List[WinnerResponse])
+async def get_raffle_winners(raffle_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version = await db.scalar(select(Raffle.version).where(Raffle.id == raffle_id))
+    if version is not None:
+        not_modified = _check_etag(request, response, _raffle_etag("winners", raffle_id, version))
+        if not_modified:
+            return not_modified
+    
+    rows = (await db.execute(
+        _winner_details_query().where(Winner.raffle_id == raffle_id)
+    )).mappings().all()
+    return [dict(row) for row in rows]
 
 @router.get("/winners/{raffle_id}/whatsapp-links", response_model=WhatsAppLinksResponse)
-def get_whatsapp_links(
+async def get_whatsapp_links(
     raffle_id: int, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+    raffle = await db.get(Raffle, raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
-    winners = db.query(Winner).filter(Winner.raffle_id == raffle_id).all()
+    winners = (await db.execute(
+        select(
+            User.name.label("winner_name"),
+            User.phone.label("winner_phone"),
+            Ticket.ticket_number,
+            Winner.prize_position,
+            Winner.whatsapp_link
+        )
+        .join(User, User.id == Winner.user_id)
+        .join(Ticket, Ticket.id == Winner.ticket_id)
+        .where(Winner.raffle_id == raffle_id)
+        .order_by(Winner.prize_position)
+    )).mappings().all()
     
     if not winners:
         raise HTTPException(status_code=404, detail="No hay ganadores para esta rifa")
     
-    winners_details = []
-    for winner in winners:
-        user = db.query(User).filter(User.id == winner.user_id).first()
-        ticket = db.query(Ticket).filter(Ticket.id == winner.ticket_id).first()
-        
-        winners_details.append({
-            "winner_name": user.name,
-            "winner_phone": user.phone,
-            "ticket_number": ticket.ticket_number,
-            "prize_position": winner.prize_position,
-            "whatsapp_link": winner.whatsapp_link
-        })
+    winners_details = [dict(winner) for winner in winners]
     
     return {
         "raffle_id": raffle_id,
@@ -710,28 +1370,30 @@ def get_whatsapp_links(
     }
 
 @router.put("/winners/{winner_id}/mark-notified")
-def mark_winner_notified(
+async def mark_winner_notified(
     winner_id: int,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    winner = db.query(Winner).filter(Winner.id == winner_id).first()
+    winner = await db.get(Winner, winner_id)
     if not winner:
         raise HTTPException(status_code=404, detail="Ganador no encontrado")
     
     winner.notified = True
     winner.notification_date = datetime.utcnow()
-    db.commit()
+    new_version = await _bump_raffle_version(db, winner.raffle_id)
+    await db.commit()
+    occupancy.advance(winner.raffle_id, new_version)
     
     return {"message": "Ganador marcado como notificado"}
 
 @router.get("/stats/raffle/{raffle_id}")
-def get_raffle_stats(
+async def get_raffle_stats(
     raffle_id: int, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    raffle = db.query(Raffle).filter(Raffle.id == raffle_id).first()
+    raffle = await db.get(Raffle, raffle_id)
     if not raffle:
         raise HTTPException(status_code=404, detail="Rifa no encontrada")
     
@@ -752,16 +1414,89 @@ def get_raffle_stats(
         "is_completed": raffle.is_completed
     }
 
+@router.get("/stats/cache")
+async def get_cache_stats(current_admin: AdminPrincipal = Depends(get_current_admin)):
+    """Aciertos y fallos de la caché de respuestas, para dimensionarla"""
+    return response_cache.as_dict()
+
+@router.get("/stats/reservations")
+async def get_reservation_sweeper_stats(current_admin: AdminPrincipal = Depends(get_current_admin)):
+    return sweeper_metrics.as_dict()
+
+async def _hash_password(password: str) -> str:
+    try:
+        return await password_pool.hash(password)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Servidor ocupado, intente de nuevo en unos segundos",
+            headers={"Retry-After": "1"},
+        )
+
+# ========== EXPORTACIONES CSV ==========
+async def _ensure_raffle_exists(db: AsyncSession, raffle_id: int):
+    if await db.scalar(select(Raffle.id).where(Raffle.id == raffle_id)) is None:
+        raise HTTPException(status_code=404, detail="Rifa no encontrada")
+
+@router.get("/export/tickets/raffle/{raffle_id}")
+async def export_raffle_tickets(
+    raffle_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    await _ensure_raffle_exists(db, raffle_id)
+    query = (
+        select(
+            Ticket.id,
+            Ticket.ticket_number,
+            Ticket.status,
+            Ticket.payment_confirmed,
+            Ticket.purchase_date,
+            Ticket.payment_date,
+            Ticket.is_winner,
+            User.id.label("user_id"),
+            User.name.label("user_name"),
+            User.phone.label("user_phone")
+        )
+        .join(User, User.id == Ticket.user_id)
+        .where(Ticket.raffle_id == raffle_id)
+        .order_by(Ticket.id)
+    )
+    return _csv_response(request, query, f"rifa-{raffle_id}-tickets.csv")
+
+@router.get("/export/tickets/pending")
+async def export_pending_tickets(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    query = _pending_tickets_query(db.bind.dialect.name).order_by(Ticket.id)
+    return _csv_response(request, query, "pagos-pendientes.csv")
+
+@router.get("/export/winners/raffle/{raffle_id}")
+async def export_raffle_winners(
+    raffle_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    await _ensure_raffle_exists(db, raffle_id)
+    query = _winner_details_query().where(Winner.raffle_id == raffle_id)
+    return _csv_response(request, query, f"rifa-{raffle_id}-ganadores.csv")
+
 # ========== RUTAS DE ADMINISTRACIÓN ==========
 @router.post("/admin/admins/", response_model=AdminResponse, status_code=status.HTTP_201_CREATED)
-def create_admin(
+async def create_admin(
     admin_data: AdminCreate, 
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    existing_admin = db.query(Admin).filter(
-        (Admin.username == admin_data.username) | (Admin.email == admin_data.email)
-    ).first()
+    existing_admin = await db.scalar(
+        select(Admin).where(
+            (Admin.username == admin_data.username) | (Admin.email == admin_data.email)
+        )
+    )
     if existing_admin:
         raise HTTPException(status_code=400, detail="El nombre de usuario o email ya existe")
     
@@ -772,21 +1507,21 @@ def create_admin(
         is_active=True,
         is_main_admin=False
     )
-    db_admin.set_password(admin_data.password)
+    db_admin.password_hash = await _hash_password(admin_data.password)
     
     db.add(db_admin)
-    db.commit()
-    db.refresh(db_admin)
+    await db.commit()
+    await db.refresh(db_admin)
     return db_admin
 
 @router.put("/admin/admins/{admin_id}", response_model=AdminResponse)
-def update_admin(
+async def update_admin(
     admin_id: int,
     admin_data: AdminUpdate,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    admin_to_update = db.query(Admin).filter(Admin.id == admin_id).first()
+    admin_to_update = await db.get(Admin, admin_id)
     if not admin_to_update:
         raise HTTPException(status_code=404, detail="Administrador no encontrado")
     
@@ -797,7 +1532,7 @@ def update_admin(
         )
     
     if admin_data.email:
-        existing = db.query(Admin).filter(Admin.email == admin_data.email, Admin.id != admin_id).first()
+        existing = await db.scalar(select(Admin).where(Admin.email == admin_data.email, Admin.id != admin_id))
         if existing:
             raise HTTPException(status_code=400, detail="El email ya está en uso")
         admin_to_update.email = admin_data.email
@@ -806,66 +1541,82 @@ def update_admin(
         admin_to_update.phone = admin_data.phone
     
     if admin_data.password:
-        admin_to_update.set_password(admin_data.password)
+        admin_to_update.password_hash = await _hash_password(admin_data.password)
     
-    db.commit()
-    db.refresh(admin_to_update)
+    await db.commit()
+    invalidate_admin_cache(admin_to_update.username)
+    await db.refresh(admin_to_update)
     return admin_to_update
 
 @router.delete("/admin/admins/{admin_id}")
-def delete_admin(
+async def delete_admin(
     admin_id: int,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     if current_admin.id == admin_id:
         raise HTTPException(status_code=400, detail="No puede eliminarse a sí mismo")
     
-    admin_to_delete = db.query(Admin).filter(Admin.id == admin_id).first()
+    admin_to_delete = await db.get(Admin, admin_id)
     if not admin_to_delete:
         raise HTTPException(status_code=404, detail="Administrador no encontrado")
     
     if admin_to_delete.is_main_admin:
         raise HTTPException(status_code=400, detail="No se puede eliminar al administrador principal")
     
-    db.delete(admin_to_delete)
-    db.commit()
+    await db.delete(admin_to_delete)
+    await db.commit()
+    invalidate_admin_cache(admin_to_delete.username)
     return {"message": "Administrador eliminado exitosamente"}
 
 @router.get("/admin/admins/", response_model=List[AdminResponse])
-def get_admins(
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+async def get_admins(
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    admins = db.query(Admin).all()
+    admins = (await db.scalars(select(Admin))).all()
     return admins
 
 @router.get("/stats/overview")
-def get_overview_stats(
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+async def get_overview_stats(
+    db: AsyncSession = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    total_raffles = db.query(Raffle).count()
-    active_raffles = db.query(Raffle).filter(Raffle.is_active == True).count()
-    completed_raffles = db.query(Raffle).filter(Raffle.is_completed == True).count()
-    
-    total_users = db.query(User).count()
-    total_tickets_sold = db.query(Ticket).filter(Ticket.status == TicketStatus.PAID).count()
-    total_tickets_reserved = db.query(Ticket).filter(Ticket.status == TicketStatus.RESERVED).count()
-    
-    # Calcular ingresos totales de manera más eficiente
-    from sqlalchemy import func
-    revenue_result = db.query(func.sum(Raffle.tickets_sold * Raffle.ticket_price)).scalar()
-    total_revenue = revenue_result if revenue_result else 0
-    
-    return {
-        "total_raffles": total_raffles,
-        "active_raffles": active_raffles,
-        "completed_raffles": completed_raffles,
-        "total_users": total_users,
-        "total_tickets_sold": total_tickets_sold,
-        "total_tickets_reserved": total_tickets_reserved,
-        "total_revenue": round(total_revenue, 2),
-        "potential_revenue": round((total_tickets_reserved * 10), 2),
+    snapshot = stats_cache.get("overview")
+    if snapshot is not None:
+        return snapshot
+    
+    # Una sola consulta: totales de rifas, de tickets (con el precio real de
+    # cada rifa) y de usuarios, combinados como subconsultas de una fila
+    raffle_totals = select(
+        func.count(Raffle.id).label("total_raffles"),
+        func.count(case((Raffle.is_active == True, 1))).label("active_raffles"),
+        func.count(case((Raffle.is_completed == True, 1))).label("completed_raffles")
+    ).subquery()
+    ticket_totals = select(
+        func.count(case((Ticket.status == TicketStatus.PAID, 1))).label("total_tickets_sold"),
+        func.count(case((Ticket.status == TicketStatus.RESERVED, 1))).label("total_tickets_reserved"),
+        func.coalesce(func.sum(case((Ticket.status == TicketStatus.PAID, Raffle.ticket_price), else_=0)), 0).label("total_revenue"),
+        func.coalesce(func.sum(case((Ticket.status == TicketStatus.RESERVED, Raffle.ticket_price), else_=0)), 0).label("potential_revenue")
+    ).select_from(Ticket).join(Raffle, Raffle.id == Ticket.raffle_id).subquery()
+    user_totals = select(func.count(User.id).label("total_users")).subquery()
+    
+    totals = (await db.execute(
+        select(raffle_totals, ticket_totals, user_totals).select_from(
+            raffle_totals.join(ticket_totals, true()).join(user_totals, true())
+        )
+    )).mappings().one()
+    
+    snapshot = {
+        "total_raffles": totals["total_raffles"],
+        "active_raffles": totals["active_raffles"],
+        "completed_raffles": totals["completed_raffles"],
+        "total_users": totals["total_users"],
+        "total_tickets_sold": totals["total_tickets_sold"],
+        "total_tickets_reserved": totals["total_tickets_reserved"],
+        "total_revenue": round(totals["total_revenue"], 2),
+        "potential_revenue": round(totals["potential_revenue"], 2),
         "last_updated": datetime.utcnow().isoformat()
     }
+    stats_cache.set("overview", snapshot)
+    return snapshot
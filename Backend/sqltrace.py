@@ -0,0 +1,110 @@
+"""
+Atribución de cada sentencia SQL a la petición HTTP que la emitió.
+
+Los eventos del engine suman cantidad y tiempo de las consultas en un
+ContextVar por petición. SQLAlchemy ejecuta el engine async en un greenlet que
+hereda el contexto de la tarea que lo llama, así que el conteo funciona igual
+con el engine async que con el síncrono. Con DEBUG activo cada respuesta lleva
+X-DB-Queries / X-DB-Time, y las sentencias más lentas que
+SLOW_QUERY_THRESHOLD_MS se registran con su SQL normalizado y la ruta.
+"""
+from contextvars import ContextVar
+from typing import Optional
+import logging
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# Listas de parámetros (?, ?, ?) / ($1, $2) / (%(a)s, %(b)s) colapsadas a (...)
+_PLACEHOLDER = r"\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)\s*"
+_PARAM_LIST = re.compile(rf"\((?:{_PLACEHOLDER},)+{_PLACEHOLDER}\)")
+_VALUES_ROWS = re.compile(r"(VALUES \(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    """SQL en una línea y sin listas largas de parámetros, para agrupar en los logs"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _PARAM_LIST.sub("(...)", statement)
+    return _VALUES_ROWS.sub(r"\1, ...", statement)
+
+
+class QueryStats:
+    __slots__ = ("scope", "count", "seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return f"{self.scope['method']} {route_template(self.scope)}"
+
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+# El inicio se guarda en el contexto de ejecución y no en la conexión: si la
+# sentencia falla after_cursor_execute no se llama, y el contexto se descarta
+# con ella en lugar de quedar en una conexión que vuelve al pool
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+    if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+        logger.warning(
+            f"Consulta lenta ({elapsed * 1000:.1f} ms) en "
+            f"{stats.route if stats else 'tarea en segundo plano'}: {normalize_sql(statement)}"
+        )
+
+
+def install(engine: Engine):
+    """Registra los eventos en un engine síncrono (o en async_engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLTraceMiddleware:
+    """Abre las estadísticas de la petición y, en DEBUG, las devuelve como headers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = current_query_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and settings.DEBUG:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.count).encode()),
+                    (b"x-db-time", f"{stats.seconds * 1000:.2f}ms".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_query_stats.reset(token)
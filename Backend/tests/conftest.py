@@ -0,0 +1,48 @@
+"""
+Configuración común de los tests: base SQLite temporal, DEBUG activo para que
+cada respuesta lleve X-DB-Queries y un cliente httpx sobre la app ASGI en
+proceso. El lifespan se abre una sola vez por sesión en su propio loop.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Antes de importar la app: el engine y la configuración se crean al importarse
+_db_dir = tempfile.mkdtemp(prefix="raffle-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["DEBUG"] = "true"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app import app  # noqa: E402
+from config import settings  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def client(loop):
+    lifespan = app.router.lifespan_context(app)
+    loop.run_until_complete(lifespan.__aenter__())
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    yield client
+    loop.run_until_complete(client.aclose())
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
+
+
+@pytest.fixture(scope="session")
+def admin_headers(loop, client):
+    response = loop.run_until_complete(client.post(
+        "/api/auth/login",
+        json={"username": settings.ADMIN_USERNAME, "password": settings.ADMIN_PASSWORD}
+    ))
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
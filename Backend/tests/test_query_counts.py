@@ -0,0 +1,94 @@
+"""
+Los listados deben hacer un número fijo de consultas sin importar cuántas
+filas devuelven (sin N+1). El conteo sale del header X-DB-Queries.
+"""
+from datetime import datetime
+from itertools import count
+
+from database import AsyncSessionLocal
+from models import User, Raffle, Ticket, Winner, TicketStatus
+
+_phones = count(1)
+
+
+async def _create_raffle(title: str) -> int:
+    async with AsyncSessionLocal() as db:
+        raffle = Raffle(
+            title=title, total_tickets=1000, ticket_price=5.0,
+            prize_first="Primero", prize_second="Segundo", prize_third="Tercero"
+        )
+        db.add(raffle)
+        await db.commit()
+        return raffle.id
+
+
+async def _add_tickets(raffle_id: int, first_number: int, quantity: int, status: TicketStatus):
+    """Un usuario nuevo por ticket; devuelve los tickets creados"""
+    async with AsyncSessionLocal() as db:
+        tickets = []
+        for number in range(first_number, first_number + quantity):
+            phone = next(_phones)
+            user = User(name=f"Usuario {phone}", phone=f"9{phone:09d}")
+            db.add(user)
+            await db.flush()
+            tickets.append(Ticket(
+                ticket_number=number, user_id=user.id, raffle_id=raffle_id, status=status,
+                payment_confirmed=status == TicketStatus.PAID,
+                payment_date=datetime.utcnow() if status == TicketStatus.PAID else None
+            ))
+        db.add_all(tickets)
+        await db.commit()
+        return [(ticket.id, ticket.user_id) for ticket in tickets]
+
+
+async def _add_winners(raffle_id: int, positions: int):
+    tickets = await _add_tickets(raffle_id, 1, positions, TicketStatus.PAID)
+    async with AsyncSessionLocal() as db:
+        db.add_all(
+            Winner(
+                user_id=user_id, raffle_id=raffle_id, ticket_id=ticket_id, prize_position=position,
+                prize_description=f"{position}° Lugar", whatsapp_link="https://wa.me/"
+            )
+            for position, (ticket_id, user_id) in enumerate(tickets, start=1)
+        )
+        await db.commit()
+
+
+def _get(loop, client, path, headers=None):
+    """(consultas, cuerpo) de un GET que debe responder 200"""
+    response = loop.run_until_complete(client.get(path, headers=headers))
+    assert response.status_code == 200, response.text
+    return int(response.headers["x-db-queries"]), response.json()
+
+
+def test_pending_tickets_query_count_is_constant(loop, client, admin_headers):
+    raffle_id = loop.run_until_complete(_create_raffle("Pendientes"))
+    loop.run_until_complete(_add_tickets(raffle_id, 1, 3, TicketStatus.RESERVED))
+    _get(loop, client, "/api/tickets/pending", admin_headers)
+
+    few_queries, few = _get(loop, client, "/api/tickets/pending", admin_headers)
+    loop.run_until_complete(_add_tickets(raffle_id, 100, 40, TicketStatus.RESERVED))
+    many_queries, many = _get(loop, client, "/api/tickets/pending", admin_headers)
+
+    assert len(many) == len(few) + 40
+    assert many_queries == few_queries
+
+
+def test_winner_routes_query_count_is_constant(loop, client, admin_headers):
+    one_winner = loop.run_until_complete(_create_raffle("Un ganador"))
+    three_winners = loop.run_until_complete(_create_raffle("Tres ganadores"))
+    loop.run_until_complete(_add_winners(one_winner, 1))
+    loop.run_until_complete(_add_winners(three_winners, 3))
+
+    for path, headers, key in (
+        ("/api/winners/raffle/{}", None, None),
+        ("/api/winners/{}/whatsapp-links", admin_headers, "winners"),
+    ):
+        _get(loop, client, path.format(one_winner), headers)
+        few_queries, few = _get(loop, client, path.format(one_winner), headers)
+        many_queries, many = _get(loop, client, path.format(three_winners), headers)
+
+        if key:
+            few, many = few[key], many[key]
+        assert (len(few), len(many)) == (1, 3)
+        assert many_queries == few_queries, path
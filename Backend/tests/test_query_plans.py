@@ -0,0 +1,107 @@
+"""
+Las consultas calientes de tickets y winners deben resolverse con sus índices
+y no con un recorrido completo de la tabla. Se revisa el plan de SQLite
+(EXPLAIN QUERY PLAN) sobre un conjunto sintético con estadísticas (ANALYZE).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, text
+
+from database import engine, init_db
+from models import User, Raffle, Ticket, Winner, TicketStatus, ACTIVE_TICKET_STATUSES
+
+RAFFLES = 4
+TICKETS_PER_RAFFLE = 300
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """(raffle_id, user_id) de un conjunto con tickets en todos los estados"""
+    init_db()
+    now = datetime.utcnow()
+    statuses = (TicketStatus.PAID,) * 8 + (TicketStatus.RESERVED, TicketStatus.CANCELLED)
+    with engine.begin() as connection:
+        raffle_ids = [
+            connection.execute(insert(Raffle).values(
+                title=f"Plan {index}", total_tickets=TICKETS_PER_RAFFLE, ticket_price=1,
+                prize_first="1", prize_second="2", prize_third="3"
+            )).inserted_primary_key[0]
+            for index in range(RAFFLES)
+        ]
+        user_ids = [
+            connection.execute(insert(User).values(name=f"Plan {index}", phone=f"81{index:08d}")).inserted_primary_key[0]
+            for index in range(30)
+        ]
+        connection.execute(insert(Ticket), [
+            {
+                "ticket_number": number,
+                "user_id": user_ids[number % len(user_ids)],
+                "raffle_id": raffle_id,
+                "purchase_date": now - timedelta(hours=number),
+                "status": statuses[number % len(statuses)],
+                "payment_confirmed": statuses[number % len(statuses)] == TicketStatus.PAID,
+            }
+            for raffle_id in raffle_ids
+            for number in range(1, TICKETS_PER_RAFFLE + 1)
+        ])
+        ticket_id = connection.scalar(select(Ticket.id).where(Ticket.raffle_id == raffle_ids[0]).limit(1))
+        connection.execute(insert(Winner).values(
+            user_id=user_ids[0], raffle_id=raffle_ids[0], ticket_id=ticket_id,
+            prize_position=1, prize_description="1° Lugar"
+        ))
+        connection.execute(text("ANALYZE"))
+    return raffle_ids[0], user_ids[0]
+
+
+HOT_QUERIES = {
+    # Compras, mapa de ocupación y sorteo
+    "tickets activos por rifa": (
+        lambda raffle_id, user_id: select(Ticket.ticket_number).where(
+            Ticket.raffle_id == raffle_id, Ticket.status.in_(ACTIVE_TICKET_STATUSES)
+        ),
+        "ix_tickets_raffle_status",
+    ),
+    "página de tickets por usuario": (
+        lambda raffle_id, user_id: select(Ticket).where(Ticket.user_id == user_id, Ticket.id > 0).order_by(Ticket.id),
+        "ix_tickets_user_id_id",
+    ),
+    "página de tickets por rifa": (
+        lambda raffle_id, user_id: select(Ticket).where(
+            Ticket.raffle_id == raffle_id, Ticket.id > 0
+        ).order_by(Ticket.id).limit(100),
+        "ix_tickets_raffle_id_id",
+    ),
+    "tickets pendientes de pago": (
+        lambda raffle_id, user_id: select(Ticket).where(
+            Ticket.status == TicketStatus.RESERVED, Ticket.payment_confirmed == False  # noqa: E712
+        ),
+        "ix_tickets_status_payment",
+    ),
+    "barrido de reservas vencidas": (
+        lambda raffle_id, user_id: select(Ticket.id).where(
+            Ticket.status == TicketStatus.RESERVED, Ticket.purchase_date < datetime(2000, 1, 1)
+        ),
+        "ix_tickets_status_purchase_date",
+    ),
+    "ganador por rifa y posición": (
+        lambda raffle_id, user_id: select(Winner).where(Winner.raffle_id == raffle_id, Winner.prize_position == 1),
+        "ix_winners_raffle_position",
+    ),
+}
+
+
+def _plan(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(seeded, name):
+    build, index_name = HOT_QUERIES[name]
+    with engine.connect() as connection:
+        plan = _plan(connection, build(*seeded))
+
+    scans = [detail for detail in plan if detail.startswith("SCAN") and "INDEX" not in detail]
+    assert not scans, f"{name}: recorrido secuencial {scans}"
+    assert any(f"INDEX {index_name} " in f"{detail} " for detail in plan), f"{name}: {plan}"
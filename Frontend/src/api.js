@@ -34,6 +34,18 @@ api.interceptors.response.use(
   }
 );
 
+// Listados paginados por cursor: se piden páginas mientras llegue X-Next-Cursor
+const getAllPages = async (url) => {
+  const items = [];
+  let afterId = null;
+  do {
+    const response = await api.get(url, { params: afterId === null ? {} : { after_id: afterId } });
+    items.push(...response.data);
+    afterId = response.headers['x-next-cursor'] || null;
+  } while (afterId !== null);
+  return { data: items };
+};
+
 // API de Autenticación
 export const loginAdmin = (credentials) => api.post('/auth/login', credentials);
 export const getCurrentAdmin = () => api.get('/auth/me');
@@ -41,7 +53,7 @@ export const getCurrentAdmin = () => api.get('/auth/me');
 // API de Usuarios
 export const createUser = (userData) => api.post('/users/', userData);
 export const getUsers = () => api.get('/users/');
-export const getUserTickets = (userId) => api.get(`/tickets/user/${userId}`);
+export const getUserTickets = (userId) => getAllPages(`/tickets/user/${userId}`);
 
 // API de Rifas
 export const createRaffle = (raffleData) => api.post('/raffles/', raffleData);
@@ -52,11 +64,30 @@ export const deleteRaffle = (id) => api.delete(`/raffles/${id}`);
 
 // API de Tickets
 export const purchaseTickets = (purchaseData) => api.post('/tickets/purchase', purchaseData);
-export const getRaffleTickets = (raffleId) => api.get(`/tickets/raffle/${raffleId}`);
+export const getRaffleTickets = (raffleId) => getAllPages(`/tickets/raffle/${raffleId}`);
+export const getRaffleTicketMap = (raffleId) => api.get(`/raffles/${raffleId}/ticket-map`);
 
 // API de Pagos Pendientes
 export const getPendingTickets = () => api.get('/tickets/pending');
 export const confirmPayment = (paymentData) => api.post('/tickets/confirm-payment', paymentData);
+export const confirmPaymentsBulk = (selection) => api.post('/tickets/confirm-payment/bulk', selection);
+
+// Exportaciones CSV: se piden con el token del admin y se guardan como archivo
+const downloadExport = async (path, filename) => {
+  const response = await api.get(path, { responseType: 'blob' });
+  const url = window.URL.createObjectURL(response.data);
+  const link = document.createElement('a');
+  link.href = url;
+  link.download = filename;
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+  window.URL.revokeObjectURL(url);
+};
+
+export const exportRaffleTickets = (raffleId) => downloadExport(`/export/tickets/raffle/${raffleId}`, `rifa-${raffleId}-tickets.csv`);
+export const exportPendingTickets = () => downloadExport('/export/tickets/pending', 'pagos-pendientes.csv');
+export const exportRaffleWinners = (raffleId) => downloadExport(`/export/winners/raffle/${raffleId}`, `rifa-${raffleId}-ganadores.csv`);
 
 // API de Sorteos
 export const performDraw = (drawData) => api.post('/draw', drawData);
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Container, Row, Col, Card, Button, Form, Alert, Table, Modal, Badge } from 'react-bootstrap';
-import { getRaffles, createRaffle, completeRaffle, deleteRaffle, getAdmins, createAdmin, updateAdmin, deleteAdmin, getStatsOverview } from '../api';
+import { getRaffles, createRaffle, completeRaffle, deleteRaffle, getAdmins, createAdmin, updateAdmin, deleteAdmin, getStatsOverview, exportRaffleTickets, exportRaffleWinners } from '../api';
 import 'font-awesome/css/font-awesome.min.css';
 import PaymentConfirmation from './PaymentConfirmation'; // Importar el componente
 
@@ -231,6 +231,14 @@ const AdminPanel = ({ admin }) => {
     }
   };
 
+  const handleExport = async (download) => {
+    try {
+      await download;
+    } catch (error) {
+      setMessage({ type: 'danger', text: 'Error al exportar el archivo' });
+    }
+  };
+
   const openUpdateAdminModal = (adminItem) => {
     setSelectedAdmin(adminItem);
     setUpdateAdminData({
@@ -581,6 +589,24 @@ const AdminPanel = ({ admin }) => {
                         </td>
                         <td>
                           <div className="d-flex gap-1">
+                            <Button
+                              variant="outline-secondary"
+                              size="sm"
+                              onClick={() => handleExport(exportRaffleTickets(raffle.id))}
+                              title="Exportar tickets (CSV)"
+                            >
+                              <i className="fa fa-download"></i>
+                            </Button>
+                            {raffle.is_completed && (
+                              <Button
+                                variant="outline-secondary"
+                                size="sm"
+                                onClick={() => handleExport(exportRaffleWinners(raffle.id))}
+                                title="Exportar ganadores (CSV)"
+                              >
+                                <i className="fa fa-trophy"></i>
+                              </Button>
+                            )}
                             {raffle.is_active && !raffle.is_completed && (
                               <Button
                                 variant="outline-danger"
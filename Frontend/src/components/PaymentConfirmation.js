@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Table, Button, Modal, Form, Alert, Badge, Card } from 'react-bootstrap';
-import { getPendingTickets, confirmPayment } from '../api';
+import { getPendingTickets, confirmPaymentsBulk, exportPendingTickets } from '../api';
 
 const PaymentConfirmation = () => {
   const [pendingTickets, setPendingTickets] = useState([]);
@@ -42,14 +42,12 @@ const PaymentConfirmation = () => {
 
     setLoading(true);
     try {
-      await confirmPayment({
-        ticket_ids: selectedTickets,
-        user_id: selectedUser
-      });
+      // Una sola petición aunque la selección abarque varios usuarios y rifas
+      const response = await confirmPaymentsBulk({ ticket_ids: selectedTickets });
       
       setMessage({ 
         type: 'success', 
-        text: `Pago confirmado para ${selectedTickets.length} ticket(s)` 
+        text: response.data.message 
       });
       
       // Resetear selección
@@ -106,6 +104,18 @@ const PaymentConfirmation = () => {
           <span className="badge bg-warning me-2">
             {pendingTickets.length} tickets pendientes
           </span>
+          {pendingTickets.length > 0 && (
+            <Button
+              variant="outline-secondary"
+              size="sm"
+              className="me-2"
+              onClick={() => exportPendingTickets().catch(() => setMessage({ type: 'danger', text: 'Error exportando pagos pendientes' }))}
+              title="Exportar CSV"
+            >
+              <i className="fa fa-download me-1"></i>
+              CSV
+            </Button>
+          )}
           {selectedTickets.length > 0 && (
             <Button
               variant="success"
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Form, Button, Card, Alert, Row, Col, Modal, Badge, ProgressBar } from 'react-bootstrap';
-import { purchaseTickets, createUser, getRaffles, getRaffleTickets, getUsers, getUserTickets } from '../api';
+import { purchaseTickets, createUser, getRaffles, getRaffleTicketMap, getUsers, getUserTickets } from '../api';
+import io from 'socket.io-client';
 import 'font-awesome/css/font-awesome.min.css';
 import './TicketPurchase.css';
 
@@ -56,6 +57,43 @@ const TicketPurchase = () => {
     }
   }, [user]);
 
+  // Cambios en vivo de la rifa seleccionada (compras, pagos y reservas vencidas)
+  useEffect(() => {
+    const raffleId = selectedRaffle?.id;
+    if (!raffleId) return;
+
+    const apiUrl = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+    const socket = io(apiUrl, {
+      transports: ['websocket', 'polling'],
+      reconnection: true,
+      reconnectionAttempts: 5,
+      reconnectionDelay: 1000
+    });
+
+    socket.on('connect', () => {
+      socket.emit('join_raffle', { raffle_id: raffleId });
+    });
+
+    socket.on('raffle_update', (data) => {
+      if (data.raffle_id !== raffleId) return;
+      const taken = new Set([...data.reserved_numbers, ...data.paid_numbers]);
+      setAvailableNumbers(prev => {
+        const available = new Set(prev.filter(number => !taken.has(number)));
+        data.released_numbers.forEach(number => available.add(number));
+        return [...available].sort((a, b) => a - b);
+      });
+      setSelectedRaffle(prev => prev && prev.id === raffleId ? {
+        ...prev,
+        tickets_sold: prev.tickets_sold + data.tickets_sold_delta,
+        tickets_reserved: prev.tickets_reserved + data.tickets_reserved_delta
+      } : prev);
+    });
+
+    return () => {
+      socket.disconnect();
+    };
+  }, [selectedRaffle?.id]);
+
   useEffect(() => {
     if (reservedUntil) {
       const timer = setInterval(() => {
@@ -133,17 +171,18 @@ const TicketPurchase = () => {
   const fetchAvailableNumbers = async (raffleId) => {
     setLoadingNumbers(true);
     try {
-      const response = await getRaffleTickets(raffleId);
-      
-      const totalTickets = selectedRaffle?.total_tickets || 100;
-      const allNumbers = Array.from({ length: totalTickets }, (_, i) => i + 1);
-      
-      const soldTickets = response.data || [];
-      const soldNumbers = soldTickets
-        .filter(t => t.status === 'paid' || t.status === 'reserved')
-        .map(ticket => ticket.ticket_number);
+      const response = await getRaffleTicketMap(raffleId);
       
-      const available = allNumbers.filter(number => !soldNumbers.includes(number));
+      // 2 bits por número: 0 libre, 1 reservado, 2 pagado
+      const { total_tickets: totalTickets, data } = response.data;
+      const packed = Uint8Array.from(atob(data), c => c.charCodeAt(0));
+      const available = [];
+      for (let number = 1; number <= totalTickets; number++) {
+        const index = number - 1;
+        if (((packed[index >> 2] >> ((index & 3) << 1)) & 3) === 0) {
+          available.push(number);
+        }
+      }
       
       setAvailableNumbers(available);
     } catch (error) {
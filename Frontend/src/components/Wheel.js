@@ -29,7 +29,9 @@ const Wheel = ({ isAdmin }) => {
     // Conectar Socket.IO - usar la URL base sin /api
     const apiUrl = process.env.REACT_APP_API_URL || 'http://localhost:8000';
     
+    // El token identifica al admin; solo él puede emitir el giro y los ganadores
     const newSocket = io(apiUrl, {
+      auth: { token: localStorage.getItem('admin_token') },
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionAttempts: 5,
@@ -72,6 +74,56 @@ const Wheel = ({ isAdmin }) => {
     }
   }, [socket, selectedRaffle]);
 
+  // Recibir solo los eventos de la rifa seleccionada (también tras reconectar)
+  useEffect(() => {
+    if (socket && selectedRaffle) {
+      const raffleId = selectedRaffle.id;
+      const join = () => socket.emit('join_raffle', { raffle_id: raffleId });
+      join();
+      socket.on('connect', join);
+      return () => {
+        socket.off('connect', join);
+        socket.emit('leave_raffle', { raffle_id: raffleId });
+      };
+    }
+  }, [socket, selectedRaffle?.id]);
+
+  // Sorteo en bloque hecho desde otra sesión: recargar ganadores y números sorteados
+  useEffect(() => {
+    if (socket && selectedRaffle) {
+      const raffleId = selectedRaffle.id;
+      const onWinnersDrawn = (data) => {
+        if (data.raffle_id === raffleId) {
+          fetchWinners(raffleId);
+          setMessage({
+            type: 'info',
+            text: `Se sortearon ${data.winners.length} ganador(es)${data.is_completed ? '; la rifa está completa' : ''}`
+          });
+        }
+      };
+      socket.on('winners_drawn', onWinnersDrawn);
+      return () => socket.off('winners_drawn', onWinnersDrawn);
+    }
+  }, [socket, selectedRaffle?.id]);
+
+  // Al unirse tarde el servidor envía el sorteo en curso: giro activo o ganadores ya anunciados
+  useEffect(() => {
+    if (socket && selectedRaffle) {
+      const raffleId = selectedRaffle.id;
+      const onDrawState = (data) => {
+        if (data.raffle_id !== raffleId) return;
+        if (data.spin) {
+          animateWheelForViewers(data.spin.angle, data.spin.winningNumber);
+        }
+        if (data.winners.length > 0) {
+          fetchWinners(raffleId);
+        }
+      };
+      socket.on('draw_state', onDrawState);
+      return () => socket.off('draw_state', onDrawState);
+    }
+  }, [socket, selectedRaffle?.id]);
+
   useEffect(() => {
     if (selectedRaffle) {
       fetchWinners(selectedRaffle.id);